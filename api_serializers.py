@@ -0,0 +1,75 @@
+"""
+API Serialization
+JSON list endpoints select only the columns behind the requested fields
+(`?fields=id,name,mobile`), read rows from a server-side cursor in batches
+and stream the array to the client one encoded batch at a time, so neither
+ORM objects nor the whole document are held in memory. orjson is used when
+installed (`pip install orjson`), otherwise the stdlib encoder.
+"""
+import json
+from datetime import date, datetime
+
+from flask import Response, stream_with_context
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+STREAM_BATCH = 1000  # rows fetched and encoded per chunk
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(value):
+    """Encode to compact JSON bytes with the fastest available encoder"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=_default).encode('utf-8')
+
+
+def parse_fields(requested, allowed, default):
+    """Field names from a `fields` query argument, validated against `allowed`; raises ValueError"""
+    if not requested:
+        return list(default)
+    fields = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown) or '(none)'}. Allowed: {', '.join(allowed)}")
+    return fields
+
+
+def iter_json_array(items):
+    """Yield a JSON array of `items` as byte chunks, encoding STREAM_BATCH items at a time"""
+    yield b'['
+    separator = b''
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= STREAM_BATCH:
+            yield separator + dumps(batch)[1:-1]
+            separator = b','
+            batch = []
+    if batch:
+        yield separator + dumps(batch)[1:-1]
+    yield b']'
+
+
+def stream_rows(session, stmt, to_item=None):
+    """Execute `stmt` on a server-side cursor and stream its rows as a JSON array response
+
+    Rows are dicts keyed by the statement's column labels, passed through
+    `to_item` if given.
+    """
+    def generate():
+        result = session.execute(stmt.execution_options(yield_per=STREAM_BATCH))
+        items = (row._asdict() for row in result)
+        if to_item is not None:
+            items = map(to_item, items)
+        yield from iter_json_array(items)
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
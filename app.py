@@ -1,69 +1,98 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, Blueprint, Response, abort, current_app, render_template, request, redirect, stream_with_context, url_for, flash, jsonify, send_file
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
+import base64
 import os
+import uuid
+from sqlalchemy.orm import joinedload
 from config import Config
-from models import db, User, Customer, Service, Staff, Appointment, AppointmentService, Transaction, LoyaltyHistory, Attendance, Promotion, CampaignStats, WhatsAppConversation
-from forms import LoginForm, CustomerForm, AppointmentForm, StaffForm, ServiceForm, PromotionForm
-from utils import generate_invoice_pdf, generate_excel_report, send_whatsapp_message, send_email
-from whatsapp_handler import WhatsAppAppointmentHandler
+from models import db, User, Customer, ArchivedCustomer, Service, Staff, Appointment, AppointmentService, Transaction, Attendance, Promotion, CampaignStats, WhatsAppConversation
+from forms import LoginForm, CustomerForm, CustomerImportForm, AppointmentForm, StaffForm, ServiceForm, PromotionForm
+from utils import generate_invoice_pdf, generate_excel_report, generate_attendance_excel, send_whatsapp_message, send_email
+from whatsapp_dispatch import dispatch_message, dispatch_messages
+from whatsapp_handler import normalize_phone
+from webhook_limits import sender_allowed, webhook_slot
+from checkout import appointment_totals, checkout_appointment, checkout_appointments_batch
+import finance_analytics
+import revenue_analytics
+import staff_analytics
+import attendance
+from finance_analytics import period_range, created_between
+from query_detector import init_query_detector
+from template_cache import init_template_cache
+from api_serializers import parse_fields, stream_rows
+from customer_import import ImportFileError, exceeds_rows, import_customers, read_rows
+import data_export
+import customer_timeline
+from customer_search import search_customers
+from db_routing import init_db_routing, read_replica
+from user_cache import load_cached_user, remember_login
+from commands import register_commands, init_db
+from segments import audience_query
+import archive
+from catalog_cache import catalog_page, render_fragment, service_choices, staff_choices
+from campaign_tracking import event_buffer, increment_counters, make_token, open_offers, read_token
 
-app = Flask(__name__)
-app.config.from_object(Config)
+bp = Blueprint('main', __name__)
+
+FINANCE_PAGE_SIZE = 50
+TIMELINE_PAGE_SIZE = 25  # customer profile timeline entries per page
+TRACKING_PIXEL = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')  # 1x1 transparent GIF
 
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
 login_manager.login_message = 'Please log in to access this page.'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_cached_user(user_id)
 
-def init_db():
-    with app.app_context():
-        db.create_all()
-        # Create default admin user if not exists
-        if not User.query.filter_by(username='admin').first():
-            admin = User(username='admin', email='admin@salon.com', role='admin')
-            admin.set_password('admin123')
-            db.session.add(admin)
-            db.session.commit()
+def create_app(config_class=Config):
+    """Application factory; does not touch the database (see `flask init-db`)"""
+    app = Flask(__name__)
+    app.config.from_object(config_class)
 
-# Ensure DB is initialized when module is imported (Flask 3 removed before_first_request)
-init_db()
+    db.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    init_db_routing(app)
+    init_query_detector(app)
+    init_template_cache(app)
+    register_commands(app)
+    return app
 
 # Routes
-@app.route('/')
+@bp.route('/')
 @login_required
 def index():
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data):
             login_user(user, remember=form.remember_me.data)
+            remember_login(user)
             next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('dashboard'))
+            return redirect(next_page) if next_page else redirect(url_for('main.dashboard'))
         flash('Invalid username or password', 'error')
     return render_template('login.html', form=form)
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
+@read_replica
 def dashboard():
     today = datetime.now().date()
     start_of_month = datetime.now().replace(day=1).date()
@@ -105,11 +134,12 @@ def dashboard():
                          recent_transactions=recent_transactions)
 
 # Customer routes
-@app.route('/customers')
+@bp.route('/customers')
 @login_required
 def customers():
     search = request.args.get('search', '')
-    # Exclude archived customers from main list
+    # Archived customers live in customers_archive; rows flagged before the split that could
+    # not be moved (see archive-flagged-customers) stay here and are hidden too
     base_query = Customer.query.filter(Customer.is_archived == False)
     if search:
         search_pattern = f'%{search}%'
@@ -121,7 +151,7 @@ def customers():
     customers_list = base_query.all()
     return render_template('customers.html', customers=customers_list, search=search)
 
-@app.route('/customers/add', methods=['GET', 'POST'])
+@bp.route('/customers/add', methods=['GET', 'POST'])
 @login_required
 def add_customer():
     form = CustomerForm()
@@ -135,39 +165,79 @@ def add_customer():
         db.session.add(customer)
         db.session.commit()
         flash('Customer added successfully!', 'success')
-        return redirect(url_for('customers'))
+        return redirect(url_for('main.customers'))
     return render_template('customer_form.html', form=form, title='Add Customer')
 
-@app.route('/customers/<int:id>')
+IMPORT_REJECTS_SHOWN = 200  # rejected rows listed on the result page (all are counted)
+
+@bp.route('/customers/import', methods=['GET', 'POST'])
+@login_required
+def import_customers_upload():
+    if current_user.role not in ['admin', 'manager']:
+        flash('You do not have permission to import customers.', 'error')
+        return redirect(url_for('main.customers'))
+
+    form = CustomerImportForm()
+    summary, rejects = None, []
+    if form.validate_on_submit():
+        upload = form.file.data
+
+        def on_reject(line, reason, raw):
+            if len(rejects) < IMPORT_REJECTS_SHOWN:
+                rejects.append({'line': line, 'reason': reason,
+                                'row': ', '.join('' if value is None else str(value) for value in raw)})
+
+        max_rows = current_app.config['CUSTOMER_IMPORT_WEB_MAX_ROWS']
+        try:
+            # Keep the request well inside the worker timeout; big files go through the CLI
+            if exceeds_rows(upload.stream, upload.filename, max_rows):
+                raise ImportFileError(f'The file has more than {max_rows} rows. Import it with '
+                                      f'`flask --app app import-customers FILE` on the server instead.')
+            for summary in import_customers(read_rows(upload.stream, upload.filename),
+                                            update_existing=form.update_existing.data, on_reject=on_reject):
+                pass
+        except ImportFileError as e:
+            flash(str(e), 'error')
+        except Exception as e:
+            db.session.rollback()
+            # Earlier batches are committed; the summary shows how far the import got
+            flash(f'Import stopped: {str(e)}', 'error')
+        else:
+            flash(f"Import finished: {summary['inserted']} added, {summary['updated']} updated, "
+                  f"{summary['rejected']} rejected.", 'success' if not summary['rejected'] else 'info')
+    return render_template('customer_import.html', form=form, summary=summary, rejects=rejects,
+                           rejects_shown=IMPORT_REJECTS_SHOWN,
+                           max_rows=current_app.config['CUSTOMER_IMPORT_WEB_MAX_ROWS'])
+
+@bp.route('/customers/<int:id>')
 @login_required
+@read_replica
 def customer_detail(id):
-    customer = Customer.query.get_or_404(id)
-    appointments = Appointment.query.filter_by(customer_id=id).order_by(
-        Appointment.appointment_date.desc()
-    ).all()
-    transactions = Transaction.query.filter_by(customer_id=id).order_by(
-        Transaction.created_at.desc()
-    ).all()
-    loyalty_history = LoyaltyHistory.query.filter_by(customer_id=id).order_by(
-        LoyaltyHistory.created_at.desc()
-    ).all()
-    return render_template('customer_detail.html', customer=customer,
-                         appointments=appointments, transactions=transactions,
-                         loyalty_history=loyalty_history)
+    customer = db.session.get(Customer, id)
+    if customer is None:
+        if db.session.get(ArchivedCustomer, id) is not None:
+            flash('This customer is archived. Unarchive them to view their details.', 'info')
+            return redirect(url_for('main.archived_customers'))
+        abort(404)
+    counts, segment = customer_timeline.timeline_summary(id)
+    timeline = customer_timeline.timeline_page(id, request.args.get('page', 1, type=int),
+                                               TIMELINE_PAGE_SIZE, counts['total'])
+    return render_template('customer_detail.html', customer=customer, counts=counts,
+                         segment=segment, timeline=timeline)
 
-@app.route('/customers/<int:id>/delete', methods=['POST'])
+@bp.route('/customers/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_customer(id):
     if current_user.role not in ['admin', 'manager']:
         flash('You do not have permission to delete customers.', 'error')
-        return redirect(url_for('customers'))
+        return redirect(url_for('main.customers'))
     
     customer = Customer.query.get_or_404(id)
     
     # Prevent deletion if there are transactions for audit integrity
     if customer.transactions:
         flash('Cannot delete customer with existing transactions. Please archive instead.', 'error')
-        return redirect(url_for('customers'))
+        return redirect(url_for('main.customers'))
     
     try:
         # Appointments have cascade delete; remove the customer
@@ -177,46 +247,61 @@ def delete_customer(id):
     except Exception as e:
         db.session.rollback()
         flash(f'Failed to delete customer: {str(e)}', 'error')
-    return redirect(url_for('customers'))
+    return redirect(url_for('main.customers'))
 
-@app.route('/customers/<int:id>/archive', methods=['POST'])
+@bp.route('/customers/<int:id>/archive', methods=['POST'])
 @login_required
 def archive_customer(id):
     if current_user.role not in ['admin', 'manager']:
         flash('You do not have permission to archive customers.', 'error')
-        return redirect(url_for('customers'))
-    customer = Customer.query.get_or_404(id)
-    if customer.is_archived:
-        flash('Customer already archived.', 'info')
-        return redirect(url_for('customers'))
-    customer.is_archived = True
-    db.session.commit()
-    flash('Customer archived successfully!', 'success')
-    return redirect(url_for('customers'))
+        return redirect(url_for('main.customers'))
+    try:
+        summary = archive.archive_customer(id)
+        db.session.commit()
+    except archive.ArchiveError as e:
+        db.session.rollback()
+        flash(f'Cannot archive customer: {str(e)}.', 'error')
+        return redirect(url_for('main.customers'))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Failed to archive customer: {str(e)}', 'error')
+        return redirect(url_for('main.customers'))
+    if summary is None:
+        flash('Customer not found or already archived.', 'info')
+        return redirect(url_for('main.customers'))
+    flash(f"Customer archived successfully! ({summary['appointments']} past appointment(s) and "
+          f"{summary['conversations']} conversation(s) moved to archives)", 'success')
+    return redirect(url_for('main.customers'))
 
-@app.route('/archives/customers')
+@bp.route('/archives/customers')
 @login_required
 def archived_customers():
-    archived = Customer.query.filter(Customer.is_archived == True).all()
+    archived = ArchivedCustomer.query.order_by(ArchivedCustomer.archived_at.desc()).all()
+    # Flagged before the hot/cold split but not movable yet (upcoming appointments)
+    archived += Customer.query.filter(Customer.is_archived == True).order_by(Customer.name).all()
     return render_template('archived_customers.html', customers=archived)
 
-@app.route('/customers/<int:id>/unarchive', methods=['POST'])
+@bp.route('/customers/<int:id>/unarchive', methods=['POST'])
 @login_required
 def unarchive_customer(id):
     if current_user.role not in ['admin', 'manager']:
         flash('You do not have permission to unarchive.', 'error')
-        return redirect(url_for('archived_customers'))
-    customer = Customer.query.get_or_404(id)
-    if not customer.is_archived:
+        return redirect(url_for('main.archived_customers'))
+    try:
+        restored = archive.unarchive_customer(id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Failed to unarchive customer: {str(e)}', 'error')
+        return redirect(url_for('main.archived_customers'))
+    if not restored:
         flash('Customer is not archived.', 'info')
-        return redirect(url_for('customers'))
-    customer.is_archived = False
-    db.session.commit()
+        return redirect(url_for('main.customers'))
     flash('Customer unarchived successfully!', 'success')
-    return redirect(url_for('archived_customers'))
+    return redirect(url_for('main.archived_customers'))
 
 # Appointment routes
-@app.route('/appointments')
+@bp.route('/appointments')
 @login_required
 def appointments():
     date_filter = request.args.get('date')
@@ -243,17 +328,23 @@ def appointments():
     appointments_list = query.order_by(Appointment.appointment_date.desc()).all()
     
     return render_template('appointments.html', appointments=appointments_list, 
-                         date_filter=date_filter, status_filter=status_filter)
+                         date_filter=date_filter, status_filter=status_filter,
+                         batch_checkout_key=uuid.uuid4().hex, now=datetime.now())
 
-@app.route('/appointments/add', methods=['GET', 'POST'])
+@bp.route('/appointments/add', methods=['GET', 'POST'])
 @login_required
 def add_appointment():
     form = AppointmentForm()
-    form.customer_id.choices = [(c.id, f"{c.name} - {c.mobile}") for c in Customer.query.all()]
-    form.staff_id.choices = [(s.id, s.name) for s in Staff.query.filter_by(is_active=True).all()]
-    form.service_ids.choices = [(s.id, f"{s.name} - ₹{s.price}") for s in Service.query.filter_by(is_active=True).all()]
+    form.staff_id.choices = staff_choices()
+    form.service_ids.choices = service_choices()
+    # Also labels the customer picker when the form is shown again
+    selected_customer = db.session.get(Customer, form.customer_id.data) if form.customer_id.data else None
     
-    if form.validate_on_submit():
+    valid = form.validate_on_submit()
+    if valid and selected_customer is None:
+        form.customer_id.errors.append('Customer not found (archived or deleted?)')
+        valid = False
+    if valid:
         try:
             appointment = Appointment(
                 customer_id=form.customer_id.data,
@@ -279,7 +370,7 @@ def add_appointment():
             
             db.session.commit()
             flash('Appointment created successfully!', 'success')
-            return redirect(url_for('appointments'))
+            return redirect(url_for('main.appointments'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error creating appointment: {str(e)}', 'error')
@@ -290,65 +381,83 @@ def add_appointment():
                 for error in errors:
                     flash(f'{field}: {error}', 'error')
     
-    return render_template('appointment_form.html', form=form, title='Add Appointment')
+    return render_template('appointment_form.html', form=form, title='Add Appointment',
+                           selected_customer=selected_customer)
 
-@app.route('/appointments/<int:id>/complete', methods=['GET', 'POST'])
+@bp.route('/appointments/<int:id>/complete', methods=['GET', 'POST'])
 @login_required
 def complete_appointment(id):
-    appointment = Appointment.query.get_or_404(id)
-    
     if request.method == 'GET':
         # Show completion form
-        total_amount = sum(aps.price for aps in appointment.services)
-        return render_template('complete_appointment.html', appointment=appointment, total_amount=total_amount)
+        appointment = Appointment.query.get_or_404(id)
+        if appointment.status == 'completed':
+            flash('Appointment is already completed.', 'info')
+            return redirect(url_for('main.appointments'))
+        total_amount = appointment_totals([appointment.id])[appointment.id]
+        return render_template('complete_appointment.html', appointment=appointment,
+                               total_amount=total_amount, idempotency_key=uuid.uuid4().hex,
+                               offers=open_offers(appointment.customer_id))
     
     # POST - Complete appointment
-    appointment.status = 'completed'
-    
-    # Create transaction
-    total_amount = sum(aps.price for aps in appointment.services)
-    discount = float(request.form.get('discount', 0))
-    tax = total_amount * 0.18  # 18% GST
-    final_amount = total_amount - discount + tax
-    
-    transaction = Transaction(
-        customer_id=appointment.customer_id,
-        appointment_id=appointment.id,
-        amount=total_amount,
-        discount=discount,
-        tax=tax,
-        total_amount=final_amount,
-        payment_method=request.form.get('payment_method', 'cash'),
-        payment_status='paid',
-        invoice_number=Transaction.generate_invoice_number()
-    )
-    
-    # Calculate loyalty points
-    from config import Config
-    points_earned = int(final_amount * Config.LOYALTY_POINTS_PER_RUPEE)
-    transaction.loyalty_points_earned = points_earned
-    
-    # Update customer
-    customer = appointment.customer
-    customer.loyalty_points += points_earned
-    customer.total_spent += final_amount
-    
-    # Add loyalty history
-    loyalty_history = LoyaltyHistory(
-        customer_id=customer.id,
-        transaction_id=transaction.id,
-        points=points_earned,
-        description=f"Points earned for transaction #{transaction.invoice_number}"
-    )
-    
-    db.session.add(transaction)
-    db.session.add(loyalty_history)
-    db.session.commit()
+    appointment = Appointment.query.get_or_404(id)
+    idempotency_key = request.form.get('idempotency_key', '').strip()
+    if not idempotency_key:
+        flash('Checkout form expired. Please try again.', 'error')
+        return redirect(url_for('main.complete_appointment', id=id))
+    
+    try:
+        transaction, created = checkout_appointment(
+            id,
+            idempotency_key,
+            discount=float(request.form.get('discount', 0) or 0),
+            payment_method=request.form.get('payment_method', 'cash')
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error completing appointment: {str(e)}', 'error')
+        return redirect(url_for('main.appointments'))
+    
+    campaign_stats_id = request.form.get('campaign_stats_id', type=int)
+    if created and campaign_stats_id:
+        # Only offers actually sent to this customer can be redeemed
+        if CampaignStats.query.filter_by(id=campaign_stats_id, customer_id=appointment.customer_id).first():
+            event_buffer.record_redeem(campaign_stats_id)
+    
+    if created:
+        flash('Appointment completed and invoice generated!', 'success')
+    else:
+        flash('Appointment was already completed; no new invoice was created.', 'info')
+    return redirect(url_for('main.appointments'))
+
+@bp.route('/appointments/complete-batch', methods=['POST'])
+@login_required
+def complete_appointments_batch():
+    appointment_ids = [int(i) for i in request.form.getlist('appointment_ids') if i.isdigit()]
+    idempotency_key = request.form.get('idempotency_key', '').strip()
+    if not appointment_ids or not idempotency_key:
+        flash('Select at least one appointment to complete.', 'error')
+        return redirect(url_for('main.appointments'))
+    
+    try:
+        completed, skipped = checkout_appointments_batch(
+            appointment_ids,
+            idempotency_key,
+            payment_method=request.form.get('payment_method', 'cash')
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error completing appointments: {str(e)}', 'error')
+        return redirect(url_for('main.appointments'))
     
-    flash('Appointment completed and invoice generated!', 'success')
-    return redirect(url_for('appointments'))
+    message = f'{completed} appointment(s) completed and invoiced.'
+    if skipped:
+        message += f' {skipped} skipped (already completed or not scheduled).'
+    flash(message, 'success' if completed else 'info')
+    return redirect(url_for('main.appointments'))
 
-@app.route('/appointments/<int:id>/cancel', methods=['POST'])
+@bp.route('/appointments/<int:id>/cancel', methods=['POST'])
 @login_required
 def cancel_appointment(id):
     appointment = Appointment.query.get_or_404(id)
@@ -356,14 +465,15 @@ def cancel_appointment(id):
     # Check if appointment can be cancelled
     if appointment.status == 'completed':
         flash('Cannot cancel a completed appointment.', 'error')
-        return redirect(url_for('appointments'))
+        return redirect(url_for('main.appointments'))
     
     if appointment.status == 'cancelled':
         flash('Appointment is already cancelled.', 'error')
-        return redirect(url_for('appointments'))
+        return redirect(url_for('main.appointments'))
     
     # Update appointment status
     appointment.status = 'cancelled'
+    staff_analytics.invalidate_week(appointment.appointment_date.date())
     db.session.commit()
     
     # Send notification to customer
@@ -388,21 +498,157 @@ def cancel_appointment(id):
     except Exception as e:
         flash(f'Appointment cancelled but notification failed: {str(e)}', 'warning')
     
-    return redirect(url_for('appointments'))
+    return redirect(url_for('main.appointments'))
+
+@bp.route('/appointments/<int:id>/no-show', methods=['POST'])
+@login_required
+def no_show_appointment(id):
+    appointment = Appointment.query.get_or_404(id)
+
+    if appointment.status != 'scheduled':
+        flash('Only scheduled appointments can be marked as no-show.', 'error')
+        return redirect(url_for('main.appointments'))
+
+    if appointment.appointment_date > datetime.now():
+        flash('An appointment can only be marked as no-show after its start time.', 'error')
+        return redirect(url_for('main.appointments'))
+
+    appointment.status = 'no-show'
+    staff_analytics.invalidate_week(appointment.appointment_date.date())
+    db.session.commit()
+    flash('Appointment marked as no-show.', 'success')
+    return redirect(url_for('main.appointments'))
 
 # Staff routes
-@app.route('/staff')
+@bp.route('/staff')
 @login_required
 def staff():
-    staff_list = Staff.query.all()
-    return render_template('staff.html', staff_list=staff_list)
+    can_manage = current_user.role in ['admin', 'manager']
+    return catalog_page(['staff'], lambda: render_template('staff.html', staff_table=render_fragment(
+        'staff', '_staff_table.html', can_manage,
+        lambda: {'staff_list': Staff.query.all(), 'can_manage': can_manage}
+    )))
+
+@bp.route('/staff/analytics')
+@login_required
+def staff_analytics_view():
+    if current_user.role not in ['admin', 'manager']:
+        flash('You do not have permission to view staff analytics.', 'error')
+        return redirect(url_for('main.staff'))
+
+    try:
+        day = datetime.strptime(request.args['week'], '%Y-%m-%d').date() if request.args.get('week') else datetime.now().date()
+    except ValueError:
+        flash('Invalid week date.', 'error')
+        return redirect(url_for('main.staff_analytics_view'))
+    week_start = staff_analytics.week_start_for(day)
+    occupancy = staff_analytics.weekly_occupancy(week_start, refresh=request.args.get('refresh') == '1')
+    return render_template('staff_analytics.html', occupancy=occupancy, week_start=week_start,
+                           previous_week=week_start - timedelta(days=7), next_week=week_start + timedelta(days=7))
+
+# Attendance routes
+def _attendance_month():
+    """(year, month) from ?month=YYYY-MM, defaulting to the current month"""
+    try:
+        month = datetime.strptime(request.args['month'], '%Y-%m') if request.args.get('month') else datetime.now()
+    except ValueError:
+        month = datetime.now()
+    return month.year, month.month
+
+@bp.route('/attendance')
+@login_required
+@read_replica
+def attendance_view():
+    year, month = _attendance_month()
+    matrix = attendance.monthly_matrix(year, month)
+    first_day = matrix['days'][0]
+    previous_month = (first_day - timedelta(days=1)).strftime('%Y-%m')
+    next_month = (first_day + timedelta(days=32)).strftime('%Y-%m')
+    staff_list = Staff.query.filter_by(is_active=True).order_by(Staff.name).all()
+    return render_template('attendance.html', matrix=matrix, staff_list=staff_list, status_codes=attendance.STATUS_CODES,
+                           month_label=first_day.strftime('%B %Y'), month_value=first_day.strftime('%Y-%m'),
+                           previous_month=previous_month, next_month=next_month)
+
+@bp.route('/attendance/export')
+@login_required
+@read_replica
+def export_attendance():
+    year, month = _attendance_month()
+    excel = generate_attendance_excel(attendance.monthly_matrix(year, month))
+    return send_file(excel, as_attachment=True, download_name=f'attendance_{year}-{month:02d}.xlsx')
+
+def _bulk_attendance(action):
+    """Shared body of the bulk check-in/check-out endpoints (JSON or form posts)"""
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        raw_ids, raw_time = payload.get('staff_ids') or [], payload.get('time')
+        if isinstance(raw_ids, (int, str)):
+            raw_ids = [raw_ids]  # a single id, not a list of them
+    else:
+        raw_ids, raw_time = request.form.getlist('staff_ids'), request.form.get('time')
+
+    error, status = None, 400
+    try:
+        staff_ids = sorted({int(staff_id) for staff_id in raw_ids})
+        when = datetime.fromisoformat(raw_time) if raw_time else None
+    except (TypeError, ValueError):
+        staff_ids, when = [], None
+        error = 'staff_ids must be integers and time an ISO 8601 date-time'
+
+    if not error and current_user.role not in ['admin', 'manager']:
+        # Staff users may only record their own attendance
+        if not current_user.staff_id or staff_ids != [current_user.staff_id]:
+            error, status = 'You can only record your own attendance.', 403
+
+    if not error:
+        valid_ids = attendance.active_staff_ids(staff_ids)
+        if not valid_ids:
+            error = 'Select at least one active staff member.'
+
+    if error:
+        if payload is not None:
+            return jsonify({'error': error}), status
+        flash(error, 'error')
+        return redirect(url_for('main.attendance_view'))
+
+    try:
+        if action == 'check_in':
+            count = attendance.bulk_check_in(valid_ids, when)
+        else:
+            count = attendance.bulk_check_out(valid_ids, when)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        if payload is not None:
+            return jsonify({'error': str(e)}), 500
+        flash(f'Error recording attendance: {str(e)}', 'error')
+        return redirect(url_for('main.attendance_view'))
+
+    skipped = sorted(set(staff_ids) - set(valid_ids))
+    if payload is not None:
+        return jsonify({'action': action, 'recorded': count, 'skipped': skipped})
+    label = 'checked in' if action == 'check_in' else 'checked out'
+    flash(f'{count} staff member(s) {label}.', 'success')
+    return redirect(url_for('main.attendance_view'))
+
+@bp.route('/api/attendance/check-in', methods=['POST'])
+@login_required
+def attendance_check_in():
+    """Bulk check-in: JSON {"staff_ids": [...], "time": optional ISO} or form staff_ids"""
+    return _bulk_attendance('check_in')
 
-@app.route('/staff/add', methods=['GET', 'POST'])
+@bp.route('/api/attendance/check-out', methods=['POST'])
+@login_required
+def attendance_check_out():
+    """Bulk check-out: JSON {"staff_ids": [...], "time": optional ISO} or form staff_ids"""
+    return _bulk_attendance('check_out')
+
+@bp.route('/staff/add', methods=['GET', 'POST'])
 @login_required
 def add_staff():
     if current_user.role not in ['admin', 'manager']:
         flash('You do not have permission to add staff.', 'error')
-        return redirect(url_for('staff'))
+        return redirect(url_for('main.staff'))
     
     form = StaffForm()
     if form.validate_on_submit():
@@ -415,15 +661,15 @@ def add_staff():
         db.session.add(staff)
         db.session.commit()
         flash('Staff added successfully!', 'success')
-        return redirect(url_for('staff'))
+        return redirect(url_for('main.staff'))
     return render_template('staff_form.html', form=form, title='Add Staff')
 
-@app.route('/staff/<int:id>/edit', methods=['GET', 'POST'])
+@bp.route('/staff/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_staff(id):
     if current_user.role not in ['admin', 'manager']:
         flash('You do not have permission to edit staff.', 'error')
-        return redirect(url_for('staff'))
+        return redirect(url_for('main.staff'))
     
     staff = Staff.query.get_or_404(id)
     form = StaffForm(obj=staff)
@@ -435,42 +681,45 @@ def edit_staff(id):
         staff.specialization = form.specialization.data
         db.session.commit()
         flash('Staff updated successfully!', 'success')
-        return redirect(url_for('staff'))
+        return redirect(url_for('main.staff'))
     
     return render_template('staff_form.html', form=form, title='Edit Staff', staff=staff)
 
-@app.route('/staff/<int:id>/delete', methods=['POST'])
+@bp.route('/staff/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_staff(id):
     if current_user.role not in ['admin', 'manager']:
         flash('You do not have permission to delete staff.', 'error')
-        return redirect(url_for('staff'))
+        return redirect(url_for('main.staff'))
     
     staff = Staff.query.get_or_404(id)
     
     # Check if staff has appointments
     if staff.appointments:
         flash('Cannot delete staff member with existing appointments. Please deactivate instead.', 'error')
-        return redirect(url_for('staff'))
+        return redirect(url_for('main.staff'))
     
     db.session.delete(staff)
     db.session.commit()
     flash('Staff deleted successfully!', 'success')
-    return redirect(url_for('staff'))
+    return redirect(url_for('main.staff'))
 
 # Service routes
-@app.route('/services')
+@bp.route('/services')
 @login_required
 def services():
-    services_list = Service.query.all()
-    return render_template('services.html', services=services_list)
+    can_manage = current_user.role in ['admin', 'manager']
+    return catalog_page(['services'], lambda: render_template('services.html', services_grid=render_fragment(
+        'services', '_services_grid.html', can_manage,
+        lambda: {'services': Service.query.all(), 'can_manage': can_manage}
+    )))
 
-@app.route('/services/add', methods=['GET', 'POST'])
+@bp.route('/services/add', methods=['GET', 'POST'])
 @login_required
 def add_service():
     if current_user.role not in ['admin', 'manager']:
         flash('You do not have permission to add services.', 'error')
-        return redirect(url_for('services'))
+        return redirect(url_for('main.services'))
     
     form = ServiceForm()
     if form.validate_on_submit():
@@ -483,15 +732,15 @@ def add_service():
         db.session.add(service)
         db.session.commit()
         flash('Service added successfully!', 'success')
-        return redirect(url_for('services'))
+        return redirect(url_for('main.services'))
     return render_template('service_form.html', form=form, title='Add Service')
 
-@app.route('/services/<int:id>/edit', methods=['GET', 'POST'])
+@bp.route('/services/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_service(id):
     if current_user.role not in ['admin', 'manager']:
         flash('You do not have permission to edit services.', 'error')
-        return redirect(url_for('services'))
+        return redirect(url_for('main.services'))
     
     service = Service.query.get_or_404(id)
     form = ServiceForm(obj=service)
@@ -503,70 +752,92 @@ def edit_service(id):
         service.duration = form.duration.data
         db.session.commit()
         flash('Service updated successfully!', 'success')
-        return redirect(url_for('services'))
+        return redirect(url_for('main.services'))
     
     return render_template('service_form.html', form=form, title='Edit Service', service=service)
 
-@app.route('/services/<int:id>/delete', methods=['POST'])
+@bp.route('/services/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_service(id):
     if current_user.role not in ['admin', 'manager']:
         flash('You do not have permission to delete services.', 'error')
-        return redirect(url_for('services'))
+        return redirect(url_for('main.services'))
     
     service = Service.query.get_or_404(id)
     
     # Check if service has appointments
     if service.appointment_services:
         flash('Cannot delete service with existing appointments. Please deactivate instead.', 'error')
-        return redirect(url_for('services'))
+        return redirect(url_for('main.services'))
     
     db.session.delete(service)
     db.session.commit()
     flash('Service deleted successfully!', 'success')
-    return redirect(url_for('services'))
+    return redirect(url_for('main.services'))
 
 # Finance routes
-@app.route('/finance')
+@bp.route('/finance')
 @login_required
+@read_replica
 def finance():
     period = request.args.get('period', 'month')  # day, week, month, year
-    today = datetime.now().date()
+    show_transactions = request.args.get('transactions', '1') != '0'
+    start_date, end_date = period_range(period)
+    
+    period_totals = finance_analytics.totals(start_date, end_date)
+    payment_methods = finance_analytics.grouped(start_date, end_date, 'payment_method')
     
-    if period == 'day':
-        start_date = today
-        end_date = today
-    elif period == 'week':
-        start_date = today - timedelta(days=7)
-        end_date = today
-    elif period == 'month':
-        start_date = datetime.now().replace(day=1).date()
-        end_date = today
-    else:  # year
-        start_date = datetime.now().replace(month=1, day=1).date()
-        end_date = today
-    
-    transactions = Transaction.query.filter(
-        db.func.date(Transaction.created_at) >= start_date,
-        db.func.date(Transaction.created_at) <= end_date
-    ).order_by(Transaction.created_at.desc()).all()
-    
-    total_revenue = sum(t.total_amount for t in transactions if t.payment_status == 'paid')
-    total_transactions = len(transactions)
+    transactions = None
+    if show_transactions:
+        query = Transaction.query.options(joinedload(Transaction.customer)).filter(
+            *created_between(start_date, end_date)
+        ).order_by(Transaction.created_at.desc())
+        transactions = query.paginate(page=request.args.get('page', 1, type=int),
+                                      per_page=FINANCE_PAGE_SIZE, error_out=False)
     
     return render_template('finance.html', transactions=transactions,
-                         period=period, total_revenue=total_revenue,
-                         total_transactions=total_transactions)
+                         period=period, total_revenue=period_totals['revenue'],
+                         total_transactions=period_totals['transactions'],
+                         totals=period_totals, payment_methods=payment_methods,
+                         show_transactions=show_transactions)
+
+@bp.route('/api/finance/summary')
+@login_required
+@read_replica
+def api_finance_summary():
+    """Aggregated finance metrics; ?period= or ?start=&end= (YYYY-MM-DD), optional ?group_by="""
+    group_by = request.args.get('group_by') or None
+    if group_by and group_by not in finance_analytics.GROUPINGS:
+        return jsonify({'error': f"group_by must be one of {', '.join(finance_analytics.GROUPINGS)}"}), 400
+    try:
+        if request.args.get('start') and request.args.get('end'):
+            start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+        else:
+            start_date, end_date = period_range(request.args.get('period', 'month'))
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD'}), 400
+    return jsonify(finance_analytics.summary(start_date, end_date, group_by))
 
-@app.route('/finance/invoice/<int:transaction_id>')
+@bp.route('/api/finance/revenue-trend')
 @login_required
+@read_replica
+def api_revenue_trend():
+    """Daily revenue, 7/30-day moving averages, WoW deltas and next-month forecast"""
+    days = min(max(request.args.get('days', 180, type=int), 30), 5 * 366)
+    return jsonify(revenue_analytics.revenue_trend(days))
+
+@bp.route('/finance/invoice/<int:transaction_id>')
+@login_required
+@read_replica
 def download_invoice(transaction_id):
     transaction = Transaction.query.get_or_404(transaction_id)
     pdf = generate_invoice_pdf(transaction)
     return send_file(pdf, as_attachment=True, download_name=f'invoice_{transaction.invoice_number}.pdf')
 
-@app.route('/finance/report')
+@bp.route('/finance/report')
 @login_required
+@read_replica
 def download_report():
     period = request.args.get('period', 'month')
     format_type = request.args.get('format', 'excel')  # excel or pdf
@@ -578,21 +849,49 @@ def download_report():
     else:
         # PDF report can be implemented similarly
         flash('PDF reports coming soon!', 'info')
-        return redirect(url_for('finance'))
+        return redirect(url_for('main.finance'))
+
+@bp.route('/export/<dataset>')
+@login_required
+@read_replica
+def export_data(dataset):
+    """Stream a full export; ?format=csv|jsonl, ?start=&end= (YYYY-MM-DD), ?since_id=, ?gzip=1"""
+    if current_user.role not in ['admin', 'manager']:
+        abort(403)
+    if dataset not in data_export.DATASETS:
+        abort(404)
+    format_type = request.args.get('format', 'csv')
+    if format_type not in data_export.FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(data_export.FORMATS)}"}), 400
+    try:
+        start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else None
+        end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD'}), 400
+    since_id = request.args.get('since_id', type=int)
+    compress = request.args.get('gzip') == '1'
+    
+    stmt = data_export.export_query(dataset, start_date, end_date, since_id)
+    chunks = data_export.export_chunks(data_export.iter_rows(db.session, stmt), data_export.export_columns(dataset),
+                                       format_type, compress)
+    filename = f"{dataset}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format_type}" + ('.gz' if compress else '')
+    return Response(stream_with_context(chunks),
+                    mimetype='application/gzip' if compress else data_export.FORMATS[format_type],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 # Promotions routes
-@app.route('/promotions')
+@bp.route('/promotions')
 @login_required
 def promotions():
-    promotions_list = Promotion.query.order_by(Promotion.created_at.desc()).all()
+    promotions_list = Promotion.query.options(joinedload(Promotion.counters)).order_by(Promotion.created_at.desc()).all()
     return render_template('promotions.html', promotions=promotions_list)
 
-@app.route('/promotions/add', methods=['GET', 'POST'])
+@bp.route('/promotions/add', methods=['GET', 'POST'])
 @login_required
 def add_promotion():
     if current_user.role not in ['admin', 'manager']:
         flash('You do not have permission to create promotions.', 'error')
-        return redirect(url_for('promotions'))
+        return redirect(url_for('main.promotions'))
     
     form = PromotionForm()
     if form.validate_on_submit():
@@ -608,96 +907,175 @@ def add_promotion():
         db.session.add(promotion)
         db.session.commit()
         flash('Promotion created successfully!', 'success')
-        return redirect(url_for('promotions'))
+        return redirect(url_for('main.promotions'))
     return render_template('promotion_form.html', form=form, title='Add Promotion')
 
-@app.route('/promotions/<int:id>/send', methods=['POST'])
+@bp.route('/promotions/<int:id>/send', methods=['POST'])
 @login_required
 def send_promotion(id):
     promotion = Promotion.query.get_or_404(id)
     send_via = request.form.getlist('send_via')  # whatsapp, email
     
-    # Get target customers
-    if promotion.target_audience == 'all':
-        customers = Customer.query.all()
-    elif promotion.target_audience == 'new_customers':
-        # Customers with less than 3 transactions
-        customers = [c for c in Customer.query.all() if len(c.transactions) < 3]
-    else:  # loyal_customers
-        customers = [c for c in Customer.query.all() if c.loyalty_points > 100]
+    # Get target customers (indexed lookups on customer_segments / loyalty points)
+    customers = audience_query(promotion.target_audience).all()
+    
+    # Track campaign stats; ids are needed for the tracking links
+    stats_rows = [CampaignStats(promotion_id=promotion.id, customer_id=customer.id) for customer in customers]
+    db.session.add_all(stats_rows)
+    db.session.flush()
     
     sent_count = 0
-    for customer in customers:
+    for customer, stats in zip(customers, stats_rows):
+        link = url_for('main.track_click', token=make_token(stats.id), _external=True)
         if 'whatsapp' in send_via:
-            send_whatsapp_message(customer.mobile, f"{promotion.title}\n{promotion.description}")
+            send_whatsapp_message(customer.mobile, f"{promotion.title}\n{promotion.description}\n{link}")
             promotion.sent_via_whatsapp = True
         
         if 'email' in send_via and customer.email:
-            send_email(customer.email, promotion.title, promotion.description)
+            send_email(customer.email, promotion.title, f"{promotion.description}\n\n{link}")
             promotion.sent_via_email = True
         
-        # Track campaign stats
-        stats = CampaignStats(
-            promotion_id=promotion.id,
-            customer_id=customer.id
-        )
-        db.session.add(stats)
         sent_count += 1
     
+    increment_counters(db.session, {promotion.id: {'sent': sent_count}})
     db.session.commit()
     flash(f'Promotion sent to {sent_count} customers!', 'success')
-    return redirect(url_for('promotions'))
+    return redirect(url_for('main.promotions'))
+
+# Campaign tracking (public: opened from customers' phones and mail clients)
+@bp.route('/t/<token>/open.gif')
+def track_open_pixel(token):
+    stats_id = read_token(token)
+    if stats_id is not None:
+        event_buffer.record_open(stats_id)
+    response = current_app.response_class(TRACKING_PIXEL, mimetype='image/gif')
+    response.headers['Cache-Control'] = 'no-store, max-age=0'
+    return response
+
+@bp.route('/t/<token>')
+def track_click(token):
+    stats_id = read_token(token)
+    if stats_id is None:
+        abort(404)
+    event_buffer.record_open(stats_id)
+    landing_url = current_app.config['CAMPAIGN_LANDING_URL']
+    if landing_url:
+        return redirect(landing_url)
+    return render_template('campaign_offer.html')
 
 # Settings route
-@app.route('/settings')
+@bp.route('/settings')
 @login_required
 def settings():
     if current_user.role != 'admin':
         flash('Only administrators can access settings.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     return render_template('settings.html')
 
 # WhatsApp Test route
-@app.route('/whatsapp-test')
+@bp.route('/whatsapp-test')
 @login_required
 def whatsapp_test_page():
     """Frontend page for testing WhatsApp booking"""
     return render_template('whatsapp_test.html')
 
 # API routes
-@app.route('/api/customers')
+# ?fields= names -> columns; only the requested columns are selected (see api_serializers.py)
+CUSTOMER_API_FIELDS = {
+    'id': Customer.id,
+    'name': Customer.name,
+    'mobile': Customer.mobile,
+    'email': Customer.email,
+    'address': Customer.address,
+    'loyalty_points': Customer.loyalty_points,
+    'total_spent': Customer.total_spent,
+    'created_at': Customer.created_at,
+}
+APPOINTMENT_API_FIELDS = ('id', 'title', 'start', 'color', 'status', 'staff_id', 'customer_id')
+APPOINTMENT_COLORS = {'scheduled': '#3b82f6', 'completed': '#10b981'}  # anything else: '#ef4444'
+
+@bp.route('/api/customers')
 @login_required
+@read_replica
 def api_customers():
-    customers = Customer.query.all()
-    return jsonify([{'id': c.id, 'name': c.name, 'mobile': c.mobile} for c in customers])
+    try:
+        fields = parse_fields(request.args.get('fields'), CUSTOMER_API_FIELDS, ('id', 'name', 'mobile'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    stmt = db.select(*[CUSTOMER_API_FIELDS[name].label(name) for name in fields]).order_by(Customer.id)
+    return stream_rows(db.session, stmt)
+
+@bp.route('/api/customers/search')
+@login_required
+def api_customer_search():
+    """Typeahead matches for ?q= (name, any later name word, or mobile prefix)"""
+    query = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', current_app.config['CUSTOMER_SEARCH_LIMIT'], type=int), 50)
+    if not query:
+        return jsonify([])
+    return jsonify(search_customers(query, max(limit, 1)))
 
-@app.route('/api/appointments')
+@bp.route('/api/appointments')
 @login_required
+@read_replica
 def api_appointments():
     start = request.args.get('start')
     end = request.args.get('end')
+    try:
+        fields = parse_fields(request.args.get('fields'), APPOINTMENT_API_FIELDS, ('id', 'title', 'start', 'color'))
+        date_range = (datetime.fromisoformat(start), datetime.fromisoformat(end)) if start and end else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if start and end:
-        appointments = Appointment.query.filter(
-            Appointment.appointment_date >= datetime.fromisoformat(start),
-            Appointment.appointment_date <= datetime.fromisoformat(end)
-        ).all()
-    else:
-        appointments = Appointment.query.all()
+    columns = [Appointment.id.label('id'), Appointment.appointment_date.label('start')]
+    if 'status' in fields or 'color' in fields:
+        columns.append(Appointment.status.label('status'))
+    for name in ('staff_id', 'customer_id'):
+        if name in fields:
+            columns.append(getattr(Appointment, name).label(name))
+    stmt = db.select(*columns).select_from(Appointment)
+    if 'title' in fields:
+        # Customer name and service names in the same query instead of lazy loads per appointment
+        stmt = stmt.add_columns(
+            Customer.name.label('customer_name'),
+            db.func.group_concat(db.literal_column("services.name ORDER BY appointment_services.id SEPARATOR ', '")).label('service_names')
+        ).outerjoin(Customer, Customer.id == Appointment.customer_id).outerjoin(
+            AppointmentService, AppointmentService.appointment_id == Appointment.id
+        ).outerjoin(Service, Service.id == AppointmentService.service_id).group_by(Appointment.id, Customer.name)
+    if date_range:
+        stmt = stmt.where(Appointment.appointment_date >= date_range[0], Appointment.appointment_date <= date_range[1])
+    stmt = stmt.order_by(Appointment.id)
     
-    events = []
-    for apt in appointments:
-        events.append({
-            'id': apt.id,
-            'title': f"{apt.customer.name} - {', '.join([aps.service.name for aps in apt.services])}",
-            'start': apt.appointment_date.isoformat(),
-            'color': '#3b82f6' if apt.status == 'scheduled' else '#10b981' if apt.status == 'completed' else '#ef4444'
-        })
+    def to_event(row):
+        event = {}
+        for name in fields:
+            if name == 'title':
+                event['title'] = f"{row['customer_name'] or 'Archived customer'} - {row['service_names'] or ''}"
+            elif name == 'start':
+                event['start'] = row['start'].isoformat()
+            elif name == 'color':
+                event['color'] = APPOINTMENT_COLORS.get(row['status'], '#ef4444')
+            else:
+                event[name] = row[name]
+        return event
     
-    return jsonify(events)
+    return stream_rows(db.session, stmt, to_event)
 
 # WhatsApp Webhook Routes
-@app.route('/webhook/whatsapp', methods=['GET', 'POST'])
+def _dispatch_webhook_messages(messages):
+    """Rate-limit, then process [(phone_number, message_text, message_id)] from one webhook delivery"""
+    # Senders over their rate are dropped with a 200 so the provider does not redeliver (see webhook_limits.py)
+    messages = [message for message in messages if sender_allowed(normalize_phone(message[0]))]
+    if not messages:
+        return jsonify({'status': 'rate_limited'}), 200
+    with webhook_slot() as admitted:
+        if not admitted:
+            return jsonify({'status': 'busy'}), 429
+        # Redeliveries are dropped, the rest serialized per phone number (see whatsapp_dispatch.py)
+        dispatch_messages(messages)
+    return jsonify({'status': 'success'}), 200
+
+@bp.route('/webhook/whatsapp', methods=['GET', 'POST'])
 def whatsapp_webhook():
     """Webhook endpoint for receiving WhatsApp messages"""
     # For GET request (webhook verification)
@@ -706,7 +1084,7 @@ def whatsapp_webhook():
         challenge = request.args.get('hub.challenge')
         
         # Set your verify token in config
-        if verify_token == app.config.get('WHATSAPP_VERIFY_TOKEN', 'salon_verify_token'):
+        if verify_token == current_app.config.get('WHATSAPP_VERIFY_TOKEN', 'salon_verify_token'):
             return challenge, 200
         return 'Invalid verification token', 403
     
@@ -720,8 +1098,10 @@ def whatsapp_webhook():
             # Extract message details based on API format
             phone_number = None
             message_text = None
+            message_id = None
+            messages = []
             
-            # Try WhatsApp Cloud API format
+            # Try WhatsApp Cloud API format (one delivery can batch several messages)
             if 'entry' in data:
                 for entry in data.get('entry', []):
                     for change in entry.get('changes', []):
@@ -731,23 +1111,26 @@ def whatsapp_webhook():
                                 if message.get('type') == 'text':
                                     phone_number = message.get('from', '').replace('whatsapp:', '')
                                     message_text = message.get('text', {}).get('body', '')
+                                    if phone_number and message_text:
+                                        messages.append((phone_number, message_text, message.get('id')))
             
             # Try Twilio format
             elif 'messages' in data:
                 message = data['messages'][0] if data['messages'] else {}
                 phone_number = message.get('from', '').replace('whatsapp:', '')
                 message_text = message.get('body', '')
+                message_id = message.get('sid') or message.get('id')
             
             # Try generic format
             else:
                 phone_number = data.get('from', '').replace('whatsapp:', '')
                 message_text = data.get('body', data.get('text', data.get('message', '')))
+                message_id = data.get('id')
             
-            if phone_number and message_text:
-                # Process the message
-                handler = WhatsAppAppointmentHandler(phone_number)
-                handler.handle_message(message_text)
-                return jsonify({'status': 'success'}), 200
+            if not messages and phone_number and message_text:
+                messages.append((phone_number, message_text, message_id))
+            if messages:
+                return _dispatch_webhook_messages(messages)
         
         # Format 2: Simple JSON format (for testing)
         elif 'from' in data or 'phone' in data:
@@ -755,9 +1138,7 @@ def whatsapp_webhook():
             message_text = data.get('body') or data.get('text') or data.get('message', '')
             
             if phone_number and message_text:
-                handler = WhatsAppAppointmentHandler(phone_number)
-                handler.handle_message(message_text)
-                return jsonify({'status': 'success'}), 200
+                return _dispatch_webhook_messages([(phone_number, message_text, data.get('id') or data.get('message_id'))])
         
         return jsonify({'status': 'no message found'}), 200
         
@@ -765,7 +1146,7 @@ def whatsapp_webhook():
         print(f"Error processing WhatsApp webhook: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
-@app.route('/webhook/whatsapp/test', methods=['POST'])
+@bp.route('/webhook/whatsapp/test', methods=['POST'])
 @login_required
 def whatsapp_test():
     """Test endpoint for WhatsApp (requires login)"""
@@ -777,13 +1158,16 @@ def whatsapp_test():
         return jsonify({'error': 'Phone number and message required'}), 400
     
     try:
-        handler = WhatsAppAppointmentHandler(phone_number)
-        response = handler.handle_message(message_text)
+        response = dispatch_message(phone_number, message_text)
         return jsonify({'status': 'success', 'response': response}), 200
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 if __name__ == '__main__':
-    init_db()
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server only; production runs `gunicorn -c gunicorn.conf.py wsgi:app`
+    app = create_app()
+    with app.app_context():
+        init_db()
+    debug = os.environ.get('FLASK_DEBUG', 'true').lower() in ['true', 'on', '1']
+    app.run(debug=debug, host='0.0.0.0', port=5000)
 
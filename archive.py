@@ -0,0 +1,167 @@
+"""
+Customer Archive (hot/cold split)
+Archiving moves a customer row, its WhatsApp conversations and its past
+unbilled appointments (cancelled, no-show) into the *_archive tables in one
+transaction, keeping their ids; unarchiving moves them back. The hot tables
+then hold only active customers, so their queries and indexes never touch
+archived rows.
+Transactions, loyalty history, campaign stats and billed appointments stay in
+the hot tables for finance and keep the customer's id. Their customer_id has
+no foreign key (drop_history_foreign_keys removes it from older databases),
+so integrity checks stay on for every other table while the customer is
+archived; their `.customer` is None until it is restored. Customers with
+scheduled or upcoming appointments are refused (ArchiveError), since
+checkout and notifications need the customer. Callers commit.
+"""
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, exists, false, insert, literal, or_, select, text
+
+from models import (db, Customer, CustomerSegment, Appointment, AppointmentService, Transaction,
+                    WhatsAppConversation, ArchivedCustomer, ArchivedAppointment,
+                    ArchivedAppointmentService, ArchivedConversation)
+from segments import refresh_segments
+
+HISTORY_TABLES = ('appointments', 'transactions', 'loyalty_history', 'campaign_stats')  # customer_id without FK
+
+
+class ArchiveError(ValueError):
+    """The customer has appointments that still need it"""
+
+
+def _move(source, target, where, **overrides):
+    """INSERT INTO target SELECT ... FROM source WHERE ...; DELETE FROM source; returns rows moved"""
+    columns = [column.name for column in target.columns if column.name in source.c or column.name in overrides]
+    rows = select(*[overrides.get(name, source.c.get(name)) for name in columns]).where(where)
+    db.session.execute(insert(target).from_select(columns, rows))
+    return db.session.execute(delete(source).where(where)).rowcount
+
+
+def drop_history_foreign_keys():
+    """Drop the customer_id -> customers foreign keys that databases created before archiving still have
+
+    Returns the (table, constraint) pairs dropped. MySQL commits DDL immediately.
+    """
+    constraints = db.session.execute(text(
+        "SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
+        "WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME = 'customers' "
+        "AND COLUMN_NAME = 'customer_id' AND TABLE_NAME IN :tables"
+    ).bindparams(bindparam('tables', expanding=True)), {'tables': list(HISTORY_TABLES)}).all()
+    for table, constraint in constraints:
+        db.session.execute(text(f'ALTER TABLE `{table}` DROP FOREIGN KEY `{constraint}`'))
+    return [tuple(row) for row in constraints]
+
+
+def archive_blockers(customer_id):
+    """Reasons a customer cannot be archived (empty if it can)"""
+    upcoming = db.session.scalar(select(exists().where(
+        Appointment.customer_id == customer_id,
+        or_(Appointment.appointment_date >= datetime.now(), Appointment.status == 'scheduled')
+    )))
+    return ['has scheduled or upcoming appointments'] if upcoming else []
+
+
+def archive_customer(customer_id):
+    """Move a customer (and related rows) to cold storage; returns a summary dict or None if not found
+
+    Raises ArchiveError if the customer has scheduled or upcoming appointments.
+    """
+    customers = Customer.__table__
+    # Serialize with checkouts, which lock the customer row too
+    locked = db.session.execute(
+        select(customers.c.id).where(customers.c.id == customer_id).with_for_update()
+    ).scalar()
+    if locked is None:
+        return None
+    blockers = archive_blockers(customer_id)
+    if blockers:
+        raise ArchiveError(f"Customer {customer_id} {', '.join(blockers)}")
+
+    archived_at = literal(datetime.utcnow())
+    summary = {'appointments': 0, 'conversations': 0}
+    # Conversations first: they reference both the customer and its appointments
+    summary['conversations'] = _move(WhatsAppConversation.__table__, ArchivedConversation.__table__,
+                                     WhatsAppConversation.customer_id == customer_id, archived_at=archived_at)
+    # Billed appointments stay hot: finance reports join them via transactions
+    appointment_ids = db.session.scalars(
+        select(Appointment.id).where(
+            Appointment.customer_id == customer_id,
+            ~exists().where(Transaction.appointment_id == Appointment.id)
+        )
+    ).all()
+    if appointment_ids:
+        _move(AppointmentService.__table__, ArchivedAppointmentService.__table__,
+              AppointmentService.appointment_id.in_(appointment_ids), archived_at=archived_at)
+        summary['appointments'] = _move(Appointment.__table__, ArchivedAppointment.__table__,
+                                        Appointment.id.in_(appointment_ids), archived_at=archived_at)
+    # Segments are derived data; they are recomputed on restore
+    db.session.execute(delete(CustomerSegment.__table__).where(CustomerSegment.customer_id == customer_id))
+    _move(customers, ArchivedCustomer.__table__, customers.c.id == customer_id,
+          is_archived=literal(True), archived_at=archived_at)
+    return summary
+
+
+def unarchive_customer(customer_id):
+    """Move an archived customer and its archived rows back to the hot tables; returns False if not archived"""
+    archived = ArchivedCustomer.__table__
+    locked = db.session.execute(
+        select(archived.c.id).where(archived.c.id == customer_id).with_for_update()
+    ).scalar()
+    if locked is None:
+        # Flagged before the hot/cold split and never moved: just clear the flag
+        flagged = Customer.query.filter(Customer.id == customer_id, Customer.is_archived == True).first()
+        if flagged is None:
+            return False
+        flagged.is_archived = False
+        return True
+
+    # Parents first, so foreign keys are satisfied
+    # A fresh updated_at lets other workers' customer search indexes pick the customer up again
+    _move(archived, Customer.__table__, archived.c.id == customer_id, is_archived=false(),
+          updated_at=literal(datetime.utcnow()))
+    appointment_ids = db.session.scalars(
+        select(ArchivedAppointment.id).where(ArchivedAppointment.customer_id == customer_id)
+    ).all()
+    if appointment_ids:
+        _move(ArchivedAppointment.__table__, Appointment.__table__, ArchivedAppointment.id.in_(appointment_ids))
+        _move(ArchivedAppointmentService.__table__, AppointmentService.__table__,
+              ArchivedAppointmentService.appointment_id.in_(appointment_ids))
+    _move(ArchivedConversation.__table__, WhatsAppConversation.__table__,
+          ArchivedConversation.customer_id == customer_id)
+    refresh_segments([customer_id])
+    return True
+
+
+def archived_customer_id_by_mobile(mobile):
+    """Id of the most recently archived customer with this mobile number, if any"""
+    return db.session.scalar(
+        select(ArchivedCustomer.id).where(ArchivedCustomer.mobile == mobile)
+        .order_by(ArchivedCustomer.archived_at.desc()).limit(1)
+    )
+
+
+def archive_flagged_customers(batch_size=100):
+    """Move customers still flagged is_archived in the hot table (pre hot/cold data); yields (moved, skipped)
+
+    Customers with scheduled or upcoming appointments are skipped and stay flagged in place (hidden from
+    the customer list, shown under Archives).
+    """
+    moved = skipped = 0
+    last_id = 0
+    while True:
+        customer_ids = db.session.scalars(
+            select(Customer.id).where(Customer.is_archived == True, Customer.id > last_id)
+            .order_by(Customer.id).limit(batch_size)
+        ).all()
+        if not customer_ids:
+            break
+        for customer_id in customer_ids:
+            try:
+                with db.session.begin_nested():
+                    archive_customer(customer_id)
+                moved += 1
+            except ArchiveError:
+                skipped += 1
+        db.session.commit()
+        last_id = customer_ids[-1]
+        yield moved, skipped
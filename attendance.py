@@ -0,0 +1,132 @@
+"""
+Staff Attendance
+Bulk check-in/check-out as a single INSERT ... ON DUPLICATE KEY UPDATE on
+the unique (staff_id, date) key, and a monthly staff x day matrix built from
+one range query with late/overtime minutes computed in MySQL.
+"""
+import calendar
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, literal, literal_column
+from sqlalchemy.dialects.mysql import insert
+
+from models import db, Attendance, Staff
+
+STATUSES = ('present', 'late', 'absent', 'leave')
+STATUS_CODES = {'present': 'P', 'late': 'L', 'absent': 'A', 'leave': 'LV'}
+
+
+def _shift_time(key):
+    return datetime.strptime(current_app.config[key], '%H:%M').time()
+
+
+def _local(when):
+    """Naive local time for `when` (default now); aware times are converted, since attendance columns are naive local"""
+    if when is None:
+        return datetime.now()
+    if when.tzinfo is not None:
+        return when.astimezone().replace(tzinfo=None)
+    return when
+
+
+def active_staff_ids(staff_ids):
+    """Subset of staff_ids that exist and are active"""
+    if not staff_ids:
+        return []
+    rows = Staff.query.with_entities(Staff.id).filter(Staff.id.in_(staff_ids), Staff.is_active == True).all()
+    return [row[0] for row in rows]
+
+
+def bulk_check_in(staff_ids, when=None):
+    """Check in many staff at once; the first check-in of the day wins"""
+    when = _local(when)
+    late_after = datetime.combine(when.date(), _shift_time('SHIFT_START')) + timedelta(
+        minutes=current_app.config['LATE_GRACE_MINUTES'])
+    status = 'late' if when > late_after else 'present'
+
+    stmt = insert(Attendance).values([
+        {'staff_id': staff_id, 'date': when.date(), 'check_in': when, 'status': status}
+        for staff_id in staff_ids
+    ])
+    table = Attendance.__table__
+    # MySQL applies assignments left to right, so status must read check_in before it is set
+    db.session.execute(stmt.on_duplicate_key_update([
+        ('status', case((table.c.check_in.is_(None), stmt.inserted.status), else_=table.c.status)),
+        ('check_in', func.coalesce(table.c.check_in, stmt.inserted.check_in)),
+    ]))
+    return len(staff_ids)
+
+
+def bulk_check_out(staff_ids, when=None):
+    """Check out many staff at once; the latest check-out of the day wins"""
+    when = _local(when)
+    stmt = insert(Attendance).values([
+        {'staff_id': staff_id, 'date': when.date(), 'check_out': when, 'status': 'present'}
+        for staff_id in staff_ids
+    ])
+    table = Attendance.__table__
+    # An earlier (e.g. back-dated) check-out never replaces a later one
+    db.session.execute(stmt.on_duplicate_key_update(check_out=func.greatest(
+        func.coalesce(table.c.check_out, stmt.inserted.check_out), stmt.inserted.check_out
+    )))
+    return len(staff_ids)
+
+
+def month_range(year, month):
+    """Return (first_day, last_day) of a month"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _minutes_after(shift_key, column):
+    """Minutes `column` falls after the shift time on the attendance date (0 if before or missing)"""
+    shift_at = func.timestamp(Attendance.date, literal(current_app.config[shift_key] + ':00'))
+    return func.coalesce(func.greatest(func.timestampdiff(literal_column('MINUTE'), shift_at, column), 0), 0)
+
+
+def monthly_matrix(year, month):
+    """Staff x day attendance matrix for a month with per-staff totals"""
+    first_day, last_day = month_range(year, month)
+    grace = current_app.config['LATE_GRACE_MINUTES']
+    late_minutes = _minutes_after('SHIFT_START', Attendance.check_in)
+
+    rows = db.session.query(
+        Attendance.staff_id,
+        Attendance.date,
+        Attendance.status,
+        Attendance.check_in,
+        Attendance.check_out,
+        case((late_minutes > grace, late_minutes), else_=0).label('late_minutes'),
+        _minutes_after('SHIFT_END', Attendance.check_out).label('overtime_minutes'),
+    ).filter(Attendance.date.between(first_day, last_day)).all()
+
+    recorded_staff = {row.staff_id for row in rows}
+    staff_rows = Staff.query.with_entities(Staff.id, Staff.name).filter(
+        (Staff.is_active == True) | Staff.id.in_(recorded_staff)
+    ).order_by(Staff.name).all()
+
+    days = [first_day + timedelta(days=offset) for offset in range(last_day.day)]
+    matrix = {
+        staff_id: {
+            'id': staff_id,
+            'name': name,
+            'days': [None] * len(days),
+            'totals': {**{status: 0 for status in STATUSES}, 'late_minutes': 0, 'overtime_minutes': 0},
+        }
+        for staff_id, name in staff_rows
+    }
+    for row in rows:
+        entry = matrix[row.staff_id]
+        entry['days'][row.date.day - 1] = {
+            'status': row.status,
+            'check_in': row.check_in,
+            'check_out': row.check_out,
+            'late_minutes': int(row.late_minutes),
+            'overtime_minutes': int(row.overtime_minutes),
+        }
+        if row.status in STATUSES:
+            entry['totals'][row.status] += 1
+        entry['totals']['late_minutes'] += int(row.late_minutes)
+        entry['totals']['overtime_minutes'] += int(row.overtime_minutes)
+
+    return {'year': year, 'month': month, 'days': days, 'staff': [matrix[staff_id] for staff_id, _ in staff_rows]}
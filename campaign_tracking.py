@@ -0,0 +1,253 @@
+"""
+Campaign Tracking
+Open/click and redemption events for promotion messages. Tracking endpoints
+only verify a signed token and append to an in-memory EventBuffer; a
+background thread per worker process flushes the buffer every
+CAMPAIGN_FLUSH_SECONDS (sooner once CAMPAIGN_BUFFER_SIZE events are pending)
+in a handful of batched statements:
+- campaign_stats rows are marked opened/redeemed (the first event wins) and
+  their open_count is incremented by every open
+- promotion_counters are incremented per promotion, so the promotions page
+  reads one counter row per campaign instead of counting campaign_stats
+Events still buffered when a worker is killed (not a graceful exit) are lost.
+While writes fail, events are kept for the next flush up to
+CAMPAIGN_BUFFER_MAX pending rows; events for further rows are dropped and
+counted in `EventBuffer.dropped`.
+"""
+import atexit
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.orm import contains_eager
+
+from models import db, CampaignStats, Promotion, PromotionCounters
+
+FLUSH_CHUNK = 1000  # campaign_stats ids per statement
+COUNTER_FIELDS = ('sent', 'opened', 'open_events', 'redeemed')
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='campaign-tracking')
+
+
+def make_token(stats_id):
+    """Signed, URL-safe token identifying one CampaignStats row"""
+    return _serializer().dumps(stats_id)
+
+
+def read_token(token):
+    """CampaignStats id from a token, or None if it was tampered with"""
+    try:
+        stats_id = _serializer().loads(token)
+    except BadSignature:
+        return None
+    return stats_id if isinstance(stats_id, int) else None
+
+
+def open_offers(customer_id):
+    """Unredeemed offers sent to a customer whose promotion is currently running"""
+    now = datetime.now()
+    return CampaignStats.query.join(Promotion).filter(
+        CampaignStats.customer_id == customer_id,
+        CampaignStats.offer_redeemed == False,
+        Promotion.is_active == True,
+        Promotion.start_date <= now,
+        Promotion.end_date >= now
+    ).options(contains_eager(CampaignStats.promotion)).order_by(Promotion.end_date).all()
+
+
+def increment_counters(connection, increments):
+    """Add {promotion_id: {field: n}} to promotion_counters in one upsert"""
+    if not increments:
+        return
+    table = PromotionCounters.__table__
+    now = datetime.utcnow()
+    # Sorted so concurrent flushes lock counter rows in the same order
+    stmt = insert(table).values([
+        {'promotion_id': promotion_id, 'updated_at': now,
+         **{field: increments[promotion_id].get(field, 0) for field in COUNTER_FIELDS}}
+        for promotion_id in sorted(increments)
+    ])
+    connection.execute(stmt.on_duplicate_key_update(
+        updated_at=stmt.inserted.updated_at,
+        **{field: table.c[field] + stmt.inserted[field] for field in COUNTER_FIELDS}
+    ))
+
+
+def write_events(connection, opens, redeems):
+    """Apply buffered events: {stats_id: [first_opened_at, count]} and {stats_id: redeemed_at}"""
+    stats = CampaignStats.__table__
+    ids = sorted(set(opens) | set(redeems))
+    increments = defaultdict(lambda: defaultdict(int))
+
+    for start in range(0, len(ids), FLUSH_CHUNK):
+        chunk = ids[start:start + FLUSH_CHUNK]
+        rows = connection.execute(
+            select(stats.c.id, stats.c.promotion_id, stats.c.message_opened, stats.c.offer_redeemed)
+            .where(stats.c.id.in_(chunk)).with_for_update()
+        ).all()
+
+        opened_at, open_counts, redeemed_at = {}, {}, {}
+        for row in rows:
+            if row.id in opens:
+                first_at, count = opens[row.id]
+                opened_at[row.id], open_counts[row.id] = first_at, count
+                increments[row.promotion_id]['open_events'] += count
+                if not row.message_opened:
+                    increments[row.promotion_id]['opened'] += 1
+            if row.id in redeems and not row.offer_redeemed:
+                redeemed_at[row.id] = redeems[row.id]
+                increments[row.promotion_id]['redeemed'] += 1
+
+        if opened_at:
+            # A row opened earlier keeps its opened_at
+            connection.execute(update(stats).where(stats.c.id.in_(list(opened_at))).values(
+                message_opened=True,
+                opened_at=func.coalesce(stats.c.opened_at, case(opened_at, value=stats.c.id)),
+                open_count=stats.c.open_count + case(open_counts, value=stats.c.id),
+            ))
+        if redeemed_at:
+            connection.execute(update(stats).where(stats.c.id.in_(list(redeemed_at))).values(
+                offer_redeemed=True, redeemed_at=case(redeemed_at, value=stats.c.id)
+            ))
+
+    increment_counters(connection, increments)
+
+
+class EventBuffer:
+    """Thread-safe, per-process buffer of campaign events with a background flusher"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._app = None
+        self._opens = {}  # stats_id -> [first_opened_at, count]
+        self._redeems = {}  # stats_id -> redeemed_at
+        self._pending = 0
+        self.dropped = 0  # events discarded because the buffer was full
+
+    def record_open(self, stats_id, when=None):
+        when = when or datetime.utcnow()
+        with self._lock:
+            self._start_worker()
+            entry = self._opens.get(stats_id)
+            if entry is not None:
+                entry[1] += 1
+            elif self._full():
+                self.dropped += 1
+                return
+            else:
+                self._opens[stats_id] = [when, 1]
+            self._count_pending()
+
+    def record_redeem(self, stats_id, when=None):
+        when = when or datetime.utcnow()
+        with self._lock:
+            self._start_worker()
+            if stats_id not in self._redeems and self._full():
+                self.dropped += 1
+                return
+            self._redeems.setdefault(stats_id, when)
+            self._count_pending()
+
+    def _full(self):
+        """True once CAMPAIGN_BUFFER_MAX rows are pending (e.g. the database has been down for a while)"""
+        return len(self._opens) + len(self._redeems) >= self._app.config['CAMPAIGN_BUFFER_MAX']
+
+    def _count_pending(self):
+        self._pending += 1
+        if self._pending >= self._app.config['CAMPAIGN_BUFFER_SIZE']:
+            self._wakeup.set()
+
+    def _start_worker(self):
+        if self._pid == os.getpid():
+            return
+        # First event in this process (or first after a fork, which does not copy threads)
+        self._pid = os.getpid()
+        self._app = current_app._get_current_object()
+        self._opens, self._redeems, self._pending = {}, {}, 0
+        threading.Thread(target=self._run, name='campaign-event-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._app.config['CAMPAIGN_FLUSH_SECONDS'])
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing campaign events: {e}")
+
+    def _drain(self):
+        with self._lock:
+            opens, redeems = self._opens, self._redeems
+            self._opens, self._redeems, self._pending = {}, {}, 0
+        return opens, redeems
+
+    def _requeue(self, opens, redeems):
+        """Merge events back after a failed flush, within CAMPAIGN_BUFFER_MAX rows; returns events dropped"""
+        dropped = 0
+        with self._lock:
+            for stats_id, (first_at, count) in opens.items():
+                entry = self._opens.get(stats_id)
+                if entry is None:
+                    if self._full():
+                        dropped += count
+                        continue
+                    entry = self._opens[stats_id] = [first_at, 0]
+                entry[0] = min(entry[0], first_at)
+                entry[1] += count
+            for stats_id, redeemed_at in redeems.items():
+                if stats_id not in self._redeems and self._full():
+                    dropped += 1
+                    continue
+                self._redeems[stats_id] = min(self._redeems.get(stats_id, redeemed_at), redeemed_at)
+            self._pending += len(opens) + len(redeems)
+            self.dropped += dropped
+        return dropped
+
+    def flush(self):
+        """Write pending events to MySQL; returns the number of rows flushed"""
+        if self._app is None or self._pid != os.getpid():
+            return 0
+        opens, redeems = self._drain()
+        if not opens and not redeems:
+            return 0
+        try:
+            with self._app.app_context(), db.engine.begin() as connection:
+                write_events(connection, opens, redeems)
+        except Exception:
+            # Keep the events for the next attempt (as many as fit)
+            if self._requeue(opens, redeems):
+                print(f"Campaign event buffer full: {self.dropped} events dropped so far")
+            raise
+        return len(opens) + len(redeems)
+
+
+event_buffer = EventBuffer()
+atexit.register(event_buffer.flush)
+
+
+def rebuild_counters():
+    """Recompute promotion_counters from campaign_stats (backfill / repair)"""
+    stats = CampaignStats.__table__
+    source = select(
+        stats.c.promotion_id,
+        func.count(stats.c.id),
+        func.coalesce(func.sum(case((stats.c.message_opened == True, 1), else_=0)), 0),
+        # Rows opened before open_count existed count once
+        func.coalesce(func.sum(case((stats.c.open_count > 0, stats.c.open_count),
+                                    (stats.c.message_opened == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((stats.c.offer_redeemed == True, 1), else_=0)), 0),
+        func.utc_timestamp(),
+    ).group_by(stats.c.promotion_id)
+    columns = ['promotion_id', *COUNTER_FIELDS, 'updated_at']
+    stmt = insert(PromotionCounters).from_select(columns, source)
+    db.session.execute(stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in columns[1:]}))
+    db.session.commit()
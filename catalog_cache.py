@@ -0,0 +1,121 @@
+"""
+Catalog Caching (services and staff)
+Services and staff change a few times a month but are listed on many pages.
+Every insert/update/delete of a Service or Staff row bumps its catalog's
+version in catalog_versions (in the same transaction), and per-process caches
+are keyed by that version, so a change is picked up by every worker on its
+next request at the cost of one primary key lookup:
+- rendered list fragments (services grid, staff table)
+- select choices for the appointment form
+Full catalog pages also carry an ETag (catalog version, user, templates) with
+`Cache-Control: private, no-cache`, so browsers revalidate and get a 304 when
+nothing changed.
+"""
+import hashlib
+import os
+import threading
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import event, select
+from sqlalchemy.dialects.mysql import insert
+
+from models import db, CatalogVersion, Service, Staff
+
+CATALOG_MODELS = {Service: 'services', Staff: 'staff'}
+
+_lock = threading.Lock()
+_entries = {}  # (catalog, key) -> (version, value)
+_template_digest = None
+
+
+def catalog_version(catalog):
+    """Current version of a catalog (read once per request)"""
+    versions = g.setdefault('catalog_versions', {})
+    if catalog not in versions:
+        versions[catalog] = db.session.scalar(
+            select(CatalogVersion.version).where(CatalogVersion.name == catalog)
+        ) or 0
+    return versions[catalog]
+
+
+def _cached(catalog, key, build):
+    """Value cached for the catalog's current version, rebuilt when the version changes"""
+    version = catalog_version(catalog)
+    entry = _entries.get((catalog, key))
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    # Built from data read after the version: a concurrent change only causes a rebuild later
+    value = build()
+    with _lock:
+        _entries[(catalog, key)] = (version, value)
+    return value
+
+
+def render_fragment(catalog, template_name, variant, load):
+    """Rendered template fragment cached per catalog version; `load()` returns its context"""
+    return _cached(catalog, (template_name, variant),
+                   lambda: Markup(current_app.jinja_env.get_template(template_name).render(**load())))
+
+
+def staff_choices():
+    """(id, name) of active staff for select fields"""
+    return _cached('staff', 'choices', lambda: [
+        (staff.id, staff.name) for staff in Staff.query.filter_by(is_active=True).order_by(Staff.id).all()
+    ])
+
+
+def service_choices():
+    """(id, "name - ₹price") of active services for select fields"""
+    return _cached('services', 'choices', lambda: [
+        (service.id, f"{service.name} - ₹{service.price}")
+        for service in Service.query.filter_by(is_active=True).order_by(Service.id).all()
+    ])
+
+
+def _templates_digest():
+    """Digest of all template sources, so a deploy with changed templates changes every ETag"""
+    global _template_digest
+    if _template_digest is None:
+        digest = hashlib.sha1()
+        template_dir = os.path.join(current_app.root_path, current_app.template_folder)
+        for root, _, files in sorted(os.walk(template_dir)):
+            for name in sorted(files):
+                with open(os.path.join(root, name), 'rb') as f:
+                    digest.update(f.read())
+        _template_digest = digest.hexdigest()[:12]
+    return _template_digest
+
+
+def catalog_page(catalogs, render):
+    """Respond with `render()` (full page) or a 304 if the browser's copy is still current"""
+    if session.get('_flashes'):
+        # Flashed messages are part of the page; never let a browser reuse it
+        return render()
+    parts = [_templates_digest(), current_user.id, current_user.username, current_user.role,
+             *[f'{catalog}:{catalog_version(catalog)}' for catalog in catalogs]]
+    etag = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def bump_version(connection, catalog):
+    """Increment a catalog's version on the given connection (inside the writing transaction)"""
+    stmt = insert(CatalogVersion.__table__).values(name=catalog, version=1)
+    connection.execute(stmt.on_duplicate_key_update(version=CatalogVersion.__table__.c.version + 1))
+
+
+def _bump_on_change(mapper, connection, target):
+    bump_version(connection, CATALOG_MODELS[type(target)])
+
+
+for _model in CATALOG_MODELS:
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _bump_on_change)
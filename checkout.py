@@ -0,0 +1,197 @@
+"""
+Appointment Checkout
+Completes appointments into transactions. Single checkouts lock the appointment
+and customer rows (SELECT ... FOR UPDATE) and are idempotent per form
+submission key; batch checkouts complete many appointments in one database
+transaction using bulk inserts/updates. Both refresh the customers' RFM
+segments in the same transaction.
+Callers commit; nothing here calls db.session.commit().
+"""
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Appointment, AppointmentService, Customer, Transaction, LoyaltyHistory, CheckoutRequest
+from segments import refresh_segments
+
+GST_RATE = 0.18  # 18% GST
+
+
+def appointment_totals(appointment_ids):
+    """Return {appointment_id: subtotal} from a single grouped query"""
+    if not appointment_ids:
+        return {}
+    rows = db.session.query(
+        AppointmentService.appointment_id, func.sum(AppointmentService.price)
+    ).filter(
+        AppointmentService.appointment_id.in_(appointment_ids)
+    ).group_by(AppointmentService.appointment_id).all()
+    totals = {appointment_id: 0.0 for appointment_id in appointment_ids}
+    totals.update({appointment_id: float(total or 0) for appointment_id, total in rows})
+    return totals
+
+
+def _bill(subtotal, discount):
+    """Return (tax, final_amount, loyalty_points) for a subtotal and discount"""
+    tax = subtotal * GST_RATE
+    final_amount = subtotal - discount + tax
+    points = int(final_amount * current_app.config['LOYALTY_POINTS_PER_RUPEE'])
+    return tax, final_amount, points
+
+
+def _claim(idempotency_key, appointment_id=None):
+    """Insert the CheckoutRequest for a key; returns (request, None), or (None, earlier request) on a replay
+
+    The unique key makes concurrent replays wait for the first submission and
+    then fail here, instead of reading a snapshot taken before they waited.
+    """
+    request = CheckoutRequest(idempotency_key=idempotency_key, appointment_id=appointment_id)
+    try:
+        with db.session.begin_nested():
+            db.session.add(request)
+    except IntegrityError:
+        previous = CheckoutRequest.query.filter_by(
+            idempotency_key=idempotency_key
+        ).populate_existing().with_for_update().one()
+        return None, previous
+    return request, None
+
+
+def checkout_appointment(appointment_id, idempotency_key, discount=0.0, payment_method='cash'):
+    """Complete one appointment; returns (transaction, created).
+
+    A replayed idempotency key or an already completed appointment returns the
+    existing transaction with created=False instead of billing twice.
+    """
+    # Lock the appointment first: concurrent submits for it queue here. populate_existing
+    # reloads an instance the caller already loaded, so the status below is the locked row's
+    appointment = db.session.query(Appointment).filter(
+        Appointment.id == appointment_id
+    ).populate_existing().with_for_update().one()
+
+    request, previous = _claim(idempotency_key, appointment.id)
+    if previous is not None:
+        return previous.transaction, False
+    if appointment.status == 'completed':
+        request.transaction = appointment.transaction
+        return appointment.transaction, False
+
+    customer = db.session.query(Customer).filter(
+        Customer.id == appointment.customer_id
+    ).populate_existing().with_for_update().one()
+
+    subtotal = appointment_totals([appointment.id])[appointment.id]
+    tax, final_amount, points_earned = _bill(subtotal, discount)
+
+    transaction = Transaction(
+        customer_id=customer.id,
+        appointment_id=appointment.id,
+        amount=subtotal,
+        discount=discount,
+        tax=tax,
+        total_amount=final_amount,
+        payment_method=payment_method,
+        payment_status='paid',
+        invoice_number=Transaction.generate_invoice_number(),
+        loyalty_points_earned=points_earned
+    )
+    appointment.status = 'completed'
+    customer.loyalty_points = (customer.loyalty_points or 0) + points_earned
+    customer.total_spent = (customer.total_spent or 0) + final_amount
+
+    # Relationships let the unit of work insert everything in one flush
+    db.session.add(transaction)
+    db.session.add(LoyaltyHistory(
+        customer_id=customer.id,
+        transaction=transaction,
+        points=points_earned,
+        description=f"Points earned for transaction #{transaction.invoice_number}"
+    ))
+    request.transaction = transaction
+    db.session.flush()
+    refresh_segments([customer.id])
+    return transaction, True
+
+
+def checkout_appointments_batch(appointment_ids, idempotency_key, payment_method='cash'):
+    """Complete many scheduled appointments in one transaction; returns (completed, skipped).
+
+    Appointments that are missing or not scheduled are skipped. A replayed
+    idempotency key completes nothing.
+    """
+    appointment_ids = sorted(set(appointment_ids))
+    if not appointment_ids:
+        return 0, 0
+
+    # Lock rows in primary-key order to avoid deadlocks with single checkouts
+    appointments = db.session.query(
+        Appointment.id, Appointment.customer_id
+    ).filter(
+        Appointment.id.in_(appointment_ids),
+        Appointment.status == 'scheduled'
+    ).order_by(Appointment.id).populate_existing().with_for_update().all()
+
+    _, previous = _claim(idempotency_key)
+    if previous is not None:
+        return 0, len(appointment_ids)
+    if not appointments:
+        return 0, len(appointment_ids)
+
+    customer_ids = sorted({customer_id for _, customer_id in appointments})
+    customers = {
+        row.id: row for row in db.session.query(
+            Customer.id, Customer.loyalty_points, Customer.total_spent
+        ).filter(Customer.id.in_(customer_ids)).order_by(Customer.id).populate_existing().with_for_update()
+    }
+
+    totals = appointment_totals([appointment_id for appointment_id, _ in appointments])
+    now = datetime.utcnow()
+    transaction_rows = []
+    customer_updates = {
+        customer_id: {'id': customer_id,
+                      'loyalty_points': customers[customer_id].loyalty_points or 0,
+                      'total_spent': customers[customer_id].total_spent or 0}
+        for customer_id in customer_ids
+    }
+    for appointment_id, customer_id in appointments:
+        subtotal = totals[appointment_id]
+        tax, final_amount, points_earned = _bill(subtotal, 0.0)
+        transaction_rows.append({
+            'customer_id': customer_id,
+            'appointment_id': appointment_id,
+            'amount': subtotal,
+            'discount': 0.0,
+            'tax': tax,
+            'total_amount': final_amount,
+            'payment_method': payment_method,
+            'payment_status': 'paid',
+            'loyalty_points_earned': points_earned,
+            'invoice_number': Transaction.generate_invoice_number(),
+            'created_at': now,
+        })
+        customer_updates[customer_id]['loyalty_points'] += points_earned
+        customer_updates[customer_id]['total_spent'] += final_amount
+
+    db.session.execute(insert(Transaction), transaction_rows)
+    invoice_ids = dict(db.session.query(Transaction.invoice_number, Transaction.id).filter(
+        Transaction.invoice_number.in_([row['invoice_number'] for row in transaction_rows])
+    ))
+    db.session.execute(insert(LoyaltyHistory), [{
+        'customer_id': row['customer_id'],
+        'transaction_id': invoice_ids[row['invoice_number']],
+        'points': row['loyalty_points_earned'],
+        'description': f"Points earned for transaction #{row['invoice_number']}",
+        'created_at': now,
+    } for row in transaction_rows])
+    db.session.execute(update(Customer), list(customer_updates.values()))
+    db.session.execute(
+        update(Appointment).where(
+            Appointment.id.in_([appointment_id for appointment_id, _ in appointments])
+        ).values(status='completed', updated_at=now),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.flush()
+    refresh_segments(customer_ids)
+    return len(appointments), len(appointment_ids) - len(appointments)
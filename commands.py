@@ -0,0 +1,161 @@
+"""
+Flask CLI commands for one-time schema and bootstrap tasks
+Run with: flask --app app <command>
+"""
+import csv
+import sys
+from datetime import date, timedelta
+
+import click
+
+from models import db, User
+from segments import rebuild_segments
+from campaign_tracking import rebuild_counters
+from archive import archive_flagged_customers, drop_history_foreign_keys
+from conversation_retention import conversation_stats, prune_conversations
+from message_dedup import purge_processed_messages
+from template_cache import precompile_templates
+from customer_import import BATCH, ImportFileError, import_customers, read_rows
+import data_export
+
+
+def init_db():
+    """Create tables and the default admin user (idempotent)"""
+    db.create_all()
+    # create_all() skips existing tables, so add indexes introduced since they were created
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    if db.engine.dialect.name == 'mysql':
+        # History rows keep an archived customer's id, so they must not reference customers
+        drop_history_foreign_keys()
+    # Create default admin user if not exists
+    if not User.query.filter_by(username='admin').first():
+        admin = User(username='admin', email='admin@salon.com', role='admin')
+        admin.set_password('admin123')
+        db.session.add(admin)
+        db.session.commit()
+
+
+def register_commands(app):
+    """Attach CLI commands to the app"""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create database tables and the default admin user."""
+        init_db()
+        click.echo('Database initialized.')
+
+    @app.cli.command('rebuild-segments')
+    @click.option('--chunk-size', default=1000, show_default=True, help='Customers recomputed per transaction.')
+    def rebuild_segments_command(chunk_size):
+        """Recompute RFM segments for all customers."""
+        processed = 0
+        for processed in rebuild_segments(chunk_size):
+            click.echo(f'{processed} customers processed...')
+        click.echo(f'Segments rebuilt for {processed} customers.')
+
+    @app.cli.command('rebuild-campaign-counters')
+    def rebuild_campaign_counters_command():
+        """Recompute per-promotion sent/opened/redeemed counters from campaign stats."""
+        rebuild_counters()
+        click.echo('Campaign counters rebuilt.')
+
+    @app.cli.command('archive-flagged-customers')
+    @click.option('--batch-size', default=100, show_default=True, help='Customers moved per transaction.')
+    def archive_flagged_customers_command(batch_size):
+        """Move customers flagged is_archived into the archive tables."""
+        moved = skipped = 0
+        for moved, skipped in archive_flagged_customers(batch_size):
+            click.echo(f'{moved} customers moved, {skipped} skipped...')
+        click.echo(f'{moved} archived customers moved to cold storage, {skipped} skipped '
+                   '(upcoming appointments; they stay flagged).')
+
+    @app.cli.command('prune-conversations')
+    def prune_conversations_command():
+        """Expire, compress and delete old WhatsApp conversations and processed message ids (run daily from cron)."""
+        result = prune_conversations()
+        click.echo(f"{result['expired']} conversations expired, {result['compressed']} compressed, "
+                   f"{result['deleted']} deleted.")
+        click.echo(f'{purge_processed_messages()} processed message ids purged.')
+
+    @app.cli.command('conversation-stats')
+    @click.option('--start', type=click.DateTime(['%Y-%m-%d']), help='First day included (default: 30 days ago).')
+    @click.option('--end', type=click.DateTime(['%Y-%m-%d']), help='Last day included (default: today).')
+    def conversation_stats_command(start, end):
+        """Print WhatsApp conversations, bookings and expiries per day, including pruned days."""
+        end_date = end.date() if end else date.today()
+        start_date = start.date() if start else end_date - timedelta(days=29)
+        rows = conversation_stats(start_date, end_date)
+        click.echo('day,conversations,booked,expired')
+        for row in rows:
+            click.echo(f"{row['day']},{row['conversations']},{row['booked']},{row['expired']}")
+        click.echo(f"{sum(row['conversations'] for row in rows)} conversations, "
+                   f"{sum(row['booked'] for row in rows)} booked, {sum(row['expired'] for row in rows)} expired.",
+                   err=True)
+
+    @app.cli.command('precompile-templates')
+    def precompile_templates_command():
+        """Compile all templates into the bytecode cache (run after deploying, before reloading)."""
+        count, seconds = precompile_templates(app)
+        click.echo(f'{count} templates compiled in {seconds * 1000:.0f} ms.')
+
+    @app.cli.command('import-customers')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--batch-size', default=BATCH, show_default=True, help='Rows written per transaction.')
+    @click.option('--skip-existing', is_flag=True, help='Leave customers whose mobile already exists unchanged.')
+    @click.option('--rejects', 'rejects_path', type=click.Path(dir_okay=False, writable=True),
+                  help='Write rejected rows (with line number and reason) to this CSV file.')
+    def import_customers_command(path, batch_size, skip_existing, rejects_path):
+        """Bulk import customers from a .csv or .xlsx file (header row: name, mobile, email, address)."""
+        rejects_file = open(rejects_path, 'w', newline='', encoding='utf-8') if rejects_path else None
+        writer = csv.writer(rejects_file) if rejects_file else None
+        if writer:
+            writer.writerow(['line', 'reason', 'row'])
+
+        def on_reject(line, reason, raw):
+            if writer:
+                writer.writerow([line, reason, *('' if value is None else value for value in raw)])
+
+        try:
+            with open(path, 'rb') as f:
+                summary = None
+                for summary in import_customers(read_rows(f, path), batch_size, not skip_existing, on_reject):
+                    click.echo(f"{summary['read']} rows read, {summary['inserted']} added, "
+                               f"{summary['updated']} updated, {summary['rejected']} rejected...")
+        except ImportFileError as e:
+            raise click.ClickException(str(e))
+        finally:
+            if rejects_file:
+                rejects_file.close()
+        click.echo(f"Import finished: {summary['inserted']} added, {summary['updated']} updated, "
+                   f"{summary['skipped']} skipped, {summary['rejected']} rejected.")
+
+    @app.cli.command('export-data')
+    @click.argument('dataset', type=click.Choice(list(data_export.DATASETS)))
+    @click.option('--format', 'format_type', type=click.Choice(list(data_export.FORMATS)), default='csv', show_default=True)
+    @click.option('--start', type=click.DateTime(['%Y-%m-%d']), help='First date included (YYYY-MM-DD).')
+    @click.option('--end', type=click.DateTime(['%Y-%m-%d']), help='Last date included (YYYY-MM-DD).')
+    @click.option('--since-id', type=int, help='Only rows with a larger id (incremental export).')
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip-compress the output.')
+    @click.option('--output', type=click.Path(dir_okay=False, writable=True), help='Output file (default: stdout).')
+    def export_data_command(dataset, format_type, start, end, since_id, compress, output):
+        """Stream customers, appointments or transactions to CSV/JSONL; prints the last exported id to stderr."""
+        stmt = data_export.export_query(dataset, start and start.date(), end and end.date(), since_id)
+        last = {'id': since_id, 'rows': 0}
+
+        def tracked(rows):
+            for row in rows:
+                last['id'], last['rows'] = row['id'], last['rows'] + 1
+                yield row
+
+        chunks = data_export.export_chunks(tracked(data_export.iter_rows(db.session, stmt)),
+                                           data_export.export_columns(dataset), format_type, compress)
+        out = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if output:
+                out.close()
+        click.echo(f"{last['rows']} {dataset} exported; last id: {last['id'] or 0}", err=True)
@@ -24,13 +24,35 @@ class Config:
         )
     SQLALCHEMY_DATABASE_URI = _database_url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Read replicas (comma-separated URLs); read-only routes are routed to them
+    SQLALCHEMY_REPLICA_URLS = [url.strip() for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url.strip()]
+    SQLALCHEMY_BINDS = {f'replica_{index}': url for index, url in enumerate(SQLALCHEMY_REPLICA_URLS)}
+    READ_AFTER_WRITE_SECONDS = int(os.environ.get('READ_AFTER_WRITE_SECONDS') or 10)  # keep a writer on the primary this long
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 30)  # seconds a logged-in user is served from memory
     
     # WhatsApp API Configuration
     WHATSAPP_API_URL = os.environ.get('WHATSAPP_API_URL') or ''
     WHATSAPP_API_KEY = os.environ.get('WHATSAPP_API_KEY') or ''
     WHATSAPP_PHONE_NUMBER = os.environ.get('WHATSAPP_PHONE_NUMBER') or '7879501625'
     WHATSAPP_VERIFY_TOKEN = os.environ.get('WHATSAPP_VERIFY_TOKEN') or 'salon_verify_token'
+    WHATSAPP_SHARDS = int(os.environ.get('WHATSAPP_SHARDS') or 4)  # per-process message queues; one phone always uses the same one
+    WHATSAPP_LOCK_TIMEOUT = int(os.environ.get('WHATSAPP_LOCK_TIMEOUT') or 10)  # seconds to wait for a phone's GET_LOCK
+    WHATSAPP_DISPATCH_TIMEOUT = int(os.environ.get('WHATSAPP_DISPATCH_TIMEOUT') or 30)  # seconds the webhook waits for a reply
+    WHATSAPP_DEDUP_CACHE_SIZE = int(os.environ.get('WHATSAPP_DEDUP_CACHE_SIZE') or 10000)  # recent provider message ids kept in memory
+    WHATSAPP_DEDUP_TTL_HOURS = int(os.environ.get('WHATSAPP_DEDUP_TTL_HOURS') or 48)  # processed ids older than this are purged
+    WHATSAPP_SENDER_RATE = float(os.environ.get('WHATSAPP_SENDER_RATE') or 0.5)  # messages/sec sustained per sender
+    WHATSAPP_SENDER_BURST = int(os.environ.get('WHATSAPP_SENDER_BURST') or 10)  # messages a sender may send at once
+    WEBHOOK_MAX_IN_FLIGHT = int(os.environ.get('WEBHOOK_MAX_IN_FLIGHT') or 2)  # per process; keep in-flight + queued < GUNICORN_THREADS
+    WEBHOOK_MAX_QUEUED = int(os.environ.get('WEBHOOK_MAX_QUEUED') or 1)
+    WEBHOOK_QUEUE_TIMEOUT = float(os.environ.get('WEBHOOK_QUEUE_TIMEOUT') or 1)  # seconds a queued delivery waits before 429
+    RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL') or ''  # optional shared limiter state (pip install redis)
+    
+    # WhatsApp conversation retention (flask --app app prune-conversations)
+    CONVERSATION_EXPIRE_HOURS = int(os.environ.get('CONVERSATION_EXPIRE_HOURS') or 24)  # unfinished bookings idle this long are closed
+    CONVERSATION_COMPRESS_DAYS = int(os.environ.get('CONVERSATION_COMPRESS_DAYS') or 30)  # finished conversations' data is compressed after
+    CONVERSATION_RETENTION_DAYS = int(os.environ.get('CONVERSATION_RETENTION_DAYS') or 180)  # ...and deleted after (0 = keep forever)
+    CONVERSATION_BATCH_SIZE = int(os.environ.get('CONVERSATION_BATCH_SIZE') or 1000)
     
     # Email Configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
@@ -42,4 +64,44 @@ class Config:
     # Loyalty Points Configuration
     LOYALTY_POINTS_PER_RUPEE = 1  # 1 point per rupee spent
     LOYALTY_REDEMPTION_RATE = 100  # 100 points = 1 rupee discount
-
+    
+    # Staff Analytics
+    SALON_OPEN_HOUR = int(os.environ.get('SALON_OPEN_HOUR') or 9)
+    SALON_CLOSE_HOUR = int(os.environ.get('SALON_CLOSE_HOUR') or 21)
+    IDLE_GAP_MINUTES = int(os.environ.get('IDLE_GAP_MINUTES') or 30)  # shortest idle stretch worth reporting
+    STAFF_STATS_TTL = int(os.environ.get('STAFF_STATS_TTL') or 600)  # seconds before the current week is recomputed
+    
+    # Attendance
+    SHIFT_START = os.environ.get('SHIFT_START') or '09:00'  # check-in after start + grace is late
+    SHIFT_END = os.environ.get('SHIFT_END') or '21:00'  # check-out after end counts as overtime
+    LATE_GRACE_MINUTES = int(os.environ.get('LATE_GRACE_MINUTES') or 10)
+    
+    # Campaign Tracking
+    CAMPAIGN_FLUSH_SECONDS = float(os.environ.get('CAMPAIGN_FLUSH_SECONDS') or 2)  # buffered open/redeem events are written this often
+    CAMPAIGN_BUFFER_SIZE = int(os.environ.get('CAMPAIGN_BUFFER_SIZE') or 5000)  # ...or as soon as this many are pending
+    CAMPAIGN_BUFFER_MAX = int(os.environ.get('CAMPAIGN_BUFFER_MAX') or 100000)  # pending rows kept while writes fail; events beyond are dropped
+    CAMPAIGN_LANDING_URL = os.environ.get('CAMPAIGN_LANDING_URL') or ''  # where tracked links redirect (default: built-in offer page)
+    
+    # Invoice Numbering
+    INVOICE_BRANCH_CODE = os.environ.get('INVOICE_BRANCH_CODE') or ''  # optional, e.g. BR1 -> INV-BR1-20250118-00042
+    INVOICE_BLOCK_SIZE = int(os.environ.get('INVOICE_BLOCK_SIZE') or 20)  # numbers reserved per DB round trip
+    
+    # Customer typeahead (see customer_search.py)
+    CUSTOMER_SEARCH_REFRESH_SECONDS = float(os.environ.get('CUSTOMER_SEARCH_REFRESH_SECONDS') or 2)  # pick up other workers' changes this often
+    CUSTOMER_SEARCH_LIMIT = int(os.environ.get('CUSTOMER_SEARCH_LIMIT') or 10)  # matches returned per lookup
+    
+    # Customer import (see customer_import.py)
+    CUSTOMER_IMPORT_WEB_MAX_ROWS = int(os.environ.get('CUSTOMER_IMPORT_WEB_MAX_ROWS') or 20000)  # larger files: flask import-customers
+    
+    # Compiled templates (see template_cache.py)
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', 'true').lower() in ['true', 'on', '1']
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR') or ''  # default: instance/jinja_cache
+    TEMPLATE_PRECOMPILE = os.environ.get('TEMPLATE_PRECOMPILE', 'true').lower() in ['true', 'on', '1']  # compile all templates in create_app()
+    
+    # Query Detector Configuration (development / CI)
+    QUERY_DETECTOR_ENABLED = os.environ.get('QUERY_DETECTOR_ENABLED', 'false').lower() in ['true', 'on', '1']
+    QUERY_DETECTOR_RAISE = os.environ.get('QUERY_DETECTOR_RAISE', 'false').lower() in ['true', 'on', '1']
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS') or 200)
+    QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD') or 5)  # identical-shape queries per request
+    QUERY_BUDGET_DEFAULT = int(os.environ.get('QUERY_BUDGET_DEFAULT') or 0)  # 0 = no default budget
+    QUERY_BUDGETS = {}  # endpoint -> max queries per request, e.g. {'main.dashboard': 10}
@@ -0,0 +1,180 @@
+"""
+WhatsApp Conversation Retention
+Keeps whatsapp_conversations small enough for the per-message active
+conversation lookup. Run `flask --app app prune-conversations` from cron:
+- active conversations idle for CONVERSATION_EXPIRE_HOURS are closed (expired)
+- finished conversations older than CONVERSATION_COMPRESS_DAYS get their JSON
+  data blob zlib-compressed (stored with a 'z:' prefix)
+- finished conversations older than CONVERSATION_RETENTION_DAYS are deleted
+  after being counted into conversation_daily_stats
+Every step works in batches of CONVERSATION_BATCH_SIZE rows, committing
+between batches, and keeps each row's updated_at.
+"""
+import base64
+import zlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, case, delete, func, select, update
+from sqlalchemy.dialects.mysql import insert
+
+from models import db, ConversationDailyStats, WhatsAppConversation
+
+EXPIRED_STEP = 'expired'
+COMPRESSED_PREFIX = 'z:'
+
+
+def pack_data(data):
+    """Compress a conversation's JSON data for long-term storage"""
+    return COMPRESSED_PREFIX + base64.b64encode(zlib.compress(data.encode('utf-8'), 9)).decode('ascii')
+
+
+def unpack_data(data):
+    """Return a conversation's JSON data, decompressing it if needed"""
+    if data and data.startswith(COMPRESSED_PREFIX):
+        return zlib.decompress(base64.b64decode(data[len(COMPRESSED_PREFIX):])).decode('utf-8')
+    return data
+
+
+def is_stale(conversation, now=None):
+    """True when an active conversation has been idle past the expiry window"""
+    now = now or datetime.utcnow()
+    last_activity = conversation.updated_at or conversation.created_at
+    return last_activity is not None and last_activity < now - timedelta(hours=current_app.config['CONVERSATION_EXPIRE_HOURS'])
+
+
+def expire_stale(now=None):
+    """Close active conversations idle past CONVERSATION_EXPIRE_HOURS; returns rows expired"""
+    table = WhatsAppConversation.__table__
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=current_app.config['CONVERSATION_EXPIRE_HOURS'])
+    batch_size = current_app.config['CONVERSATION_BATCH_SIZE']
+    expired = 0
+    while True:
+        result = db.session.execute(
+            update(table).where(
+                table.c.is_active == True,
+                table.c.updated_at < cutoff
+            ).values(is_active=False, step=EXPIRED_STEP, updated_at=table.c.updated_at)
+            .with_dialect_options(mysql_limit=batch_size)
+        )
+        db.session.commit()
+        expired += result.rowcount
+        if result.rowcount < batch_size:
+            return expired
+
+
+def compress_finished(now=None):
+    """Compress the data blob of finished conversations past CONVERSATION_COMPRESS_DAYS; returns rows compressed"""
+    table = WhatsAppConversation.__table__
+    cutoff = (now or datetime.utcnow()) - timedelta(days=current_app.config['CONVERSATION_COMPRESS_DAYS'])
+    batch_size = current_app.config['CONVERSATION_BATCH_SIZE']
+    compressed = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.data).where(
+                table.c.is_active == False,
+                table.c.updated_at < cutoff,
+                table.c.id > last_id
+            ).order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return compressed
+        last_id = rows[-1].id
+        packed = [{'row_id': row.id, 'packed': pack_data(row.data)}
+                  for row in rows if row.data and not row.data.startswith(COMPRESSED_PREFIX)]
+        if packed:
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('row_id'))
+                .values(data=bindparam('packed'), updated_at=table.c.updated_at),
+                packed
+            )
+            db.session.commit()
+            compressed += len(packed)
+
+
+def _record_daily_stats(ids):
+    """Add the conversations about to be deleted to conversation_daily_stats"""
+    table = WhatsAppConversation.__table__
+    day = func.date(table.c.created_at)
+    rows = db.session.execute(
+        select(
+            day.label('day'),
+            func.count(table.c.id).label('conversations'),
+            func.sum(case((table.c.appointment_id.isnot(None), 1), else_=0)).label('booked'),
+            func.sum(case((table.c.step == EXPIRED_STEP, 1), else_=0)).label('expired'),
+        ).where(table.c.id.in_(ids)).group_by(day)
+    ).all()
+    if not rows:
+        return
+    stats = ConversationDailyStats.__table__
+    stmt = insert(stats).values([
+        {'day': row.day, 'conversations': row.conversations, 'booked': int(row.booked or 0), 'expired': int(row.expired or 0)}
+        for row in sorted(rows, key=lambda row: row.day)
+    ])
+    db.session.execute(stmt.on_duplicate_key_update(
+        conversations=stats.c.conversations + stmt.inserted.conversations,
+        booked=stats.c.booked + stmt.inserted.booked,
+        expired=stats.c.expired + stmt.inserted.expired,
+    ))
+
+
+def delete_expired(now=None):
+    """Delete finished conversations past CONVERSATION_RETENTION_DAYS, keeping daily counts; returns rows deleted"""
+    retention_days = current_app.config['CONVERSATION_RETENTION_DAYS']
+    if not retention_days:
+        return 0
+    table = WhatsAppConversation.__table__
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    batch_size = current_app.config['CONVERSATION_BATCH_SIZE']
+    deleted = 0
+    while True:
+        ids = db.session.scalars(
+            select(table.c.id).where(
+                table.c.is_active == False,
+                table.c.updated_at < cutoff
+            ).order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return deleted
+        # Counting and deleting in one transaction keeps the stats exact
+        _record_daily_stats(ids)
+        db.session.execute(delete(table).where(table.c.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+
+
+def prune_conversations(now=None):
+    """Run the whole retention job; returns {'expired', 'compressed', 'deleted'}"""
+    now = now or datetime.utcnow()
+    return {
+        'expired': expire_stale(now),
+        'compressed': compress_finished(now),
+        'deleted': delete_expired(now),
+    }
+
+
+def conversation_stats(start_date, end_date):
+    """Per-day conversation counts: pruned totals from conversation_daily_stats plus rows still stored"""
+    table = WhatsAppConversation.__table__
+    day = func.date(table.c.created_at)
+    start = datetime.combine(start_date, datetime.min.time())
+    end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    live = db.session.execute(
+        select(
+            day.label('day'),
+            func.count(table.c.id).label('conversations'),
+            func.sum(case((table.c.appointment_id.isnot(None), 1), else_=0)).label('booked'),
+            func.sum(case((table.c.step == EXPIRED_STEP, 1), else_=0)).label('expired'),
+        ).where(table.c.created_at >= start, table.c.created_at < end).group_by(day)
+    ).all()
+    pruned = ConversationDailyStats.query.filter(ConversationDailyStats.day.between(start_date, end_date)).all()
+
+    totals = {}
+    for row in [*live, *pruned]:
+        key = str(row.day)
+        entry = totals.setdefault(key, {'day': key, 'conversations': 0, 'booked': 0, 'expired': 0})
+        entry['conversations'] += int(row.conversations or 0)
+        entry['booked'] += int(row.booked or 0)
+        entry['expired'] += int(row.expired or 0)
+    return [totals[key] for key in sorted(totals)]
@@ -0,0 +1,215 @@
+"""
+Bulk Customer Import (CSV / Excel)
+Rows are streamed from the file (csv reader, or openpyxl read-only mode for
+.xlsx) and processed BATCH rows at a time, so memory stays flat whatever the
+file size:
+- columns are matched by header (name, mobile, email, address and common
+  aliases); mobiles are normalized to the 10 digits the rest of the app stores
+- invalid rows are rejected with a reason and never written
+- each batch is checked against existing customers with one indexed
+  `mobile IN (...)` lookup; known mobiles are updated (blank cells keep the
+  stored value), new ones inserted, both as multi-row statements, and the
+  batch is committed
+- mobiles belonging to an archived customer are rejected (unarchive instead),
+  and a mobile repeated within the file keeps its last row
+"""
+import csv
+import io
+import re
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from models import db, Customer, ArchivedCustomer
+
+BATCH = 2000  # rows validated, looked up and written per transaction
+
+HEADER_ALIASES = {
+    'name': 'name', 'customer': 'name', 'customer name': 'name', 'full name': 'name',
+    'mobile': 'mobile', 'mobile number': 'mobile', 'mobile no': 'mobile', 'phone': 'mobile',
+    'phone number': 'mobile', 'contact': 'mobile',
+    'email': 'email', 'email address': 'email', 'e-mail': 'email',
+    'address': 'address',
+}
+
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+_NON_DIGITS = re.compile(r'\D')
+_NAME_MAX = Customer.__table__.c.name.type.length
+_EMAIL_MAX = Customer.__table__.c.email.type.length
+
+
+class ImportFileError(ValueError):
+    """The file cannot be imported at all (unknown type, missing required columns)"""
+
+
+def normalize_mobile(value):
+    """10-digit mobile from a cell (strips +91 / 0 prefixes and punctuation), or None if invalid"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Excel stores bare numbers as floats
+    digits = _NON_DIGITS.sub('', str(value or ''))
+    if len(digits) == 12 and digits.startswith('91'):
+        digits = digits[2:]
+    elif len(digits) == 11 and digits.startswith('0'):
+        digits = digits[1:]
+    return digits if len(digits) == 10 else None
+
+
+def _columns(header):
+    """Map of field -> column index from a header row; raises ImportFileError"""
+    columns = {}
+    for index, title in enumerate(header):
+        field = HEADER_ALIASES.get(str(title or '').strip().lower())
+        if field and field not in columns:
+            columns[field] = index
+    missing = [field for field in ('name', 'mobile') if field not in columns]
+    if missing:
+        raise ImportFileError(f"Missing required column(s): {', '.join(missing)}")
+    return columns
+
+
+def read_rows(file, filename):
+    """Yield raw rows (header first) from an uploaded/opened .csv or .xlsx file object"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        try:
+            yield from csv.reader(text)
+        finally:
+            if not file.closed:
+                text.detach()  # leave the caller's file open
+    elif extension == 'xlsx':
+        import openpyxl
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            yield from workbook.worksheets[0].iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    else:
+        raise ImportFileError('Unsupported file type; upload a .csv or .xlsx file')
+
+
+def exceeds_rows(file, filename, limit):
+    """True if a file has more than `limit` rows after the header; reads at most limit + 2 rows and rewinds"""
+    rows = read_rows(file, filename)
+    try:
+        return next(islice(rows, limit + 1, None), None) is not None
+    finally:
+        rows.close()
+        file.seek(0)
+
+
+def _clean(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _validate(raw, columns):
+    """(record, None) for a valid row or (None, reason)"""
+    def cell(field):
+        index = columns.get(field)
+        return _clean(raw[index]) if index is not None and index < len(raw) else ''
+
+    name = cell('name')
+    if not name:
+        return None, 'missing name'
+    if len(name) > _NAME_MAX:
+        return None, f'name longer than {_NAME_MAX} characters'
+    mobile = normalize_mobile(raw[columns['mobile']] if columns['mobile'] < len(raw) else None)
+    if mobile is None:
+        return None, 'invalid mobile (need 10 digits)'
+    email = cell('email').lower()
+    if email and (len(email) > _EMAIL_MAX or not _EMAIL_RE.match(email)):
+        return None, 'invalid email'
+    return {'name': name, 'mobile': mobile, 'email': email or None, 'address': cell('address') or None}, None
+
+
+def _write_batch(batch, update_existing, reject):
+    """Insert/update one batch of validated rows keyed by mobile; returns (inserted, updated, skipped)"""
+    customers = Customer.__table__
+    mobiles = list(batch)
+    existing = dict(db.session.execute(
+        select(customers.c.mobile, func.min(customers.c.id))
+        .where(customers.c.mobile.in_(mobiles)).group_by(customers.c.mobile)
+    ).all())
+    unknown = [mobile for mobile in mobiles if mobile not in existing]
+    archived = set(db.session.scalars(
+        select(ArchivedCustomer.mobile).where(ArchivedCustomer.mobile.in_(unknown))
+    ).all()) if unknown else set()
+
+    now = datetime.utcnow()
+    new_rows, updates = [], []
+    for mobile, (line, record, raw) in batch.items():
+        if mobile in existing:
+            if update_existing:
+                updates.append({**record, 'id': existing[mobile], 'updated_at': now})
+        elif mobile in archived:
+            reject(line, 'mobile belongs to an archived customer', raw)
+        else:
+            new_rows.append({**record, 'loyalty_points': 0, 'total_spent': 0.0, 'is_archived': False,
+                             'created_at': now, 'updated_at': now})
+
+    if new_rows:
+        db.session.execute(insert(customers), new_rows)
+    if updates:
+        # Upsert on the primary key: one multi-row statement instead of an UPDATE per row
+        stmt = mysql_insert(customers)
+        db.session.execute(stmt.on_duplicate_key_update(
+            name=stmt.inserted.name,
+            email=func.coalesce(stmt.inserted.email, customers.c.email),
+            address=func.coalesce(stmt.inserted.address, customers.c.address),
+            updated_at=stmt.inserted.updated_at,
+        ), updates)
+    db.session.commit()
+    skipped = len(existing) - len(updates)
+    return len(new_rows), len(updates), skipped
+
+
+def import_customers(rows, batch_size=BATCH, update_existing=True, on_reject=None):
+    """Import customers from raw rows (header first); yields a running summary dict after each batch
+
+    `on_reject(line, reason, raw_row)` is called for every rejected row; line
+    numbers count the header as line 1. Raises ImportFileError if the header
+    lacks the required columns.
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('The file is empty')
+    columns = _columns(header)
+    summary = {'read': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'rejected': 0}
+
+    def reject(line, reason, raw):
+        summary['rejected'] += 1
+        if on_reject is not None:
+            on_reject(line, reason, raw)
+
+    def flush(batch):
+        inserted, updated, skipped = _write_batch(batch, update_existing, reject)
+        summary['inserted'] += inserted
+        summary['updated'] += updated
+        summary['skipped'] += skipped
+        return dict(summary)
+
+    batch = {}  # mobile -> (line, record, raw row)
+    flushed = False
+    for line, raw in enumerate(rows, start=2):
+        if not any(_clean(value) for value in raw):
+            continue  # blank lines and trailing empty spreadsheet rows
+        summary['read'] += 1
+        record, reason = _validate(raw, columns)
+        if record is None:
+            reject(line, reason, raw)
+            continue
+        if record['mobile'] in batch:
+            summary['skipped'] += 1  # repeated within the file: the last row wins
+        batch[record['mobile']] = (line, record, raw)
+        if len(batch) >= batch_size:
+            yield flush(batch)
+            batch, flushed = {}, True
+    if batch or not flushed:
+        yield flush(batch) if batch else dict(summary)
@@ -0,0 +1,305 @@
+"""
+Customer Typeahead Search
+The appointment form looks customers up as the user types instead of
+shipping every customer as a <select> option. Each process keeps an
+in-memory prefix index: sorted arrays of normalized keys (full name, each
+later word of the name, mobile digits) searched with bisect, so a lookup is
+O(log n) plus the matches returned.
+- built before workers fork (gunicorn `when_ready` calls build_index), so
+  workers start with it; otherwise, and for large deltas, it is (re)built
+  in a background thread, never inside a request. Until the first build
+  finishes, searches use indexed name/mobile prefix queries on the table
+- kept current incrementally: Customer ORM inserts/updates/deletes in this
+  process are applied at once, and rows changed elsewhere (other workers,
+  imports, unarchiving) are picked up by an `updated_at >= last sync` query
+  at most every CUSTOMER_SEARCH_REFRESH_SECONDS
+- matches are confirmed against the table by primary key before they are
+  returned, so deleted or archived customers never show up (and are dropped
+  from the index)
+"""
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, select
+
+from models import db, Customer
+
+SYNC_OVERLAP = timedelta(seconds=60)  # re-read recent changes so slow commits are not missed
+REBUILD_THRESHOLD = 5000  # a delta larger than this rebuilds the index instead
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_name(name):
+    return ' '.join((name or '').lower().split())
+
+
+def mobile_key(mobile):
+    """Digits of a mobile (or a typed query), without a leading 91/0 on full-length numbers"""
+    digits = _NON_DIGITS.sub('', mobile or '')
+    if len(digits) > 10 and digits.startswith('91'):
+        digits = digits[2:]
+    elif len(digits) == 11 and digits.startswith('0'):
+        digits = digits[1:]
+    return digits
+
+
+def query_prefix(query):
+    """('mobile', digits) for a numeric query, ('name', normalized prefix), or (None, '') for an empty one"""
+    digits = mobile_key(query)
+    if query.lstrip().startswith('+91') and len(digits) < 10:
+        digits = digits[2:]  # partial number typed with its country code
+    if digits and not re.search(r'[^\d\s()+-]', query):
+        return 'mobile', digits
+    prefix = normalize_name(query)
+    return ('name', prefix) if prefix else (None, '')
+
+
+class SortedKeys:
+    """Sorted (key, id) pairs held as a key list and a parallel id array"""
+
+    def __init__(self, pairs=()):
+        pairs = sorted(pairs)
+        self.keys = [key for key, _ in pairs]
+        self.ids = array('q', [customer_id for _, customer_id in pairs])
+
+    def _position(self, key, customer_id):
+        """Insertion point of (key, id): ids ascend within a run of equal keys"""
+        low = bisect_left(self.keys, key)
+        high = bisect_right(self.keys, key, low)
+        return bisect_left(self.ids, customer_id, low, high)
+
+    def add(self, key, customer_id):
+        position = self._position(key, customer_id)
+        self.keys.insert(position, key)
+        self.ids.insert(position, customer_id)
+
+    def remove(self, key, customer_id):
+        position = self._position(key, customer_id)
+        if position < len(self.keys) and self.keys[position] == key and self.ids[position] == customer_id:
+            del self.keys[position]
+            del self.ids[position]
+
+    def prefixed(self, prefix):
+        """Yield ids whose key starts with `prefix`, in key order"""
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and self.keys[position].startswith(prefix):
+            yield self.ids[position]
+            position += 1
+
+
+class CustomerIndex:
+    """Prefix index over customer names and mobiles; callers hold `lock` (except around build())"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.names = SortedKeys()  # full normalized name
+        self.words = SortedKeys()  # second and later name words ("sharma" finds "Priya Sharma")
+        self.mobiles = SortedKeys()
+        self.entries = {}  # id -> (name key, mobile key), to remove old keys on change
+        self.built = False
+        self.synced_at = None
+        self.after_fork()
+
+    def after_fork(self):
+        """Keep the inherited contents (the next sync catches up) but not the parent's locks or threads"""
+        self.lock = threading.Lock()  # fresh after a fork, even if a parent thread held the old one
+        self.sync_lock = threading.Lock()
+        self.building = False
+        self.checked_at = 0.0
+        self.pid = os.getpid()
+
+    @staticmethod
+    def _keys(name, mobile):
+        # Names and their words repeat across customers; interned keys are stored once
+        return sys.intern(normalize_name(name)), mobile_key(mobile)
+
+    def build(self, rows, synced_at):
+        """Replace the contents from (id, name, mobile) rows; lookups use the old arrays until the swap"""
+        names, words, mobiles, entries = [], [], [], {}
+        for customer_id, name, mobile in rows:
+            name_key, mobile_digits = entries[customer_id] = self._keys(name, mobile)
+            names.append((name_key, customer_id))
+            words.extend((sys.intern(word), customer_id) for word in set(name_key.split()[1:]))
+            if mobile_digits:
+                mobiles.append((mobile_digits, customer_id))
+        names, words, mobiles = SortedKeys(names), SortedKeys(words), SortedKeys(mobiles)
+        with self.lock:
+            self.names, self.words, self.mobiles, self.entries = names, words, mobiles, entries
+            self.built = True
+            self.synced_at = synced_at
+
+    def remove(self, customer_id):
+        entry = self.entries.pop(customer_id, None)
+        if entry is None:
+            return
+        name_key, mobile_digits = entry
+        self.names.remove(name_key, customer_id)
+        for word in set(name_key.split()[1:]):
+            self.words.remove(word, customer_id)
+        if mobile_digits:
+            self.mobiles.remove(mobile_digits, customer_id)
+
+    def upsert(self, customer_id, name, mobile):
+        keys = self._keys(name, mobile)
+        if self.entries.get(customer_id) == keys:
+            return
+        self.remove(customer_id)
+        name_key, mobile_digits = self.entries[customer_id] = keys
+        self.names.add(name_key, customer_id)
+        for word in set(name_key.split()[1:]):
+            self.words.add(sys.intern(word), customer_id)
+        if mobile_digits:
+            self.mobiles.add(mobile_digits, customer_id)
+
+    def search(self, query, limit):
+        """Up to `limit` candidate ids: mobile prefix for numeric queries, else name then later-word prefix"""
+        kind, prefix = query_prefix(query)
+        if kind == 'mobile':
+            sources = [self.mobiles.prefixed(prefix)]
+        elif kind == 'name':
+            sources = [self.names.prefixed(prefix), self.words.prefixed(prefix)]
+        else:
+            return []
+        found = []
+        for source in sources:
+            for customer_id in source:
+                if customer_id not in found:
+                    found.append(customer_id)
+                    if len(found) >= limit:
+                        return found
+        return found
+
+
+index = CustomerIndex()
+
+
+def _rows(stmt):
+    return db.session.execute(stmt.execution_options(yield_per=10000)).tuples()
+
+
+def _columns():
+    customers = Customer.__table__
+    return select(customers.c.id, customers.c.name, customers.c.mobile)
+
+
+def build_index():
+    """Build this process's index now (in an app context); gunicorn calls it before forking workers"""
+    started = datetime.utcnow()
+    index.build(_rows(_columns()), started)
+    index.checked_at = time.monotonic()
+
+
+def _build_in_background(app):
+    try:
+        with app.app_context():
+            build_index()
+    except Exception as e:
+        app.logger.warning('Customer search index build failed (retried on the next search): %s', e)
+    finally:
+        index.building = False
+
+
+def _start_build():
+    """Start a background (re)build unless one is running; searches keep using what is there meanwhile"""
+    with index.lock:
+        if index.building:
+            return
+        index.building = True
+    threading.Thread(target=_build_in_background, args=(current_app._get_current_object(),),
+                     name='customer-search-build', daemon=True).start()
+
+
+def _sync():
+    """Start the first build, then apply rows changed since the last sync (throttled); never builds inline"""
+    if index.pid != os.getpid():
+        index.after_fork()  # forked worker: keep the master's index, catch up below
+    if not index.built:
+        _start_build()
+        return
+    refresh = current_app.config['CUSTOMER_SEARCH_REFRESH_SECONDS']
+    if time.monotonic() - index.checked_at < refresh or index.building:
+        return
+    if not index.sync_lock.acquire(blocking=False):
+        return  # another thread is syncing; this search uses the index as it is
+    try:
+        started = datetime.utcnow()
+        changed = list(_rows(
+            _columns().where(Customer.__table__.c.updated_at >= index.synced_at - SYNC_OVERLAP)
+            .limit(REBUILD_THRESHOLD + 1)
+        ))
+        index.checked_at = time.monotonic()
+        if len(changed) > REBUILD_THRESHOLD:
+            _start_build()  # a bulk change such as an import
+            return
+        with index.lock:
+            for customer_id, name, mobile in changed:
+                index.upsert(customer_id, name, mobile)
+            index.synced_at = started
+    finally:
+        index.sync_lock.release()
+
+
+def _like_prefix(prefix):
+    return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _search_table(query, limit):
+    """Name or mobile prefix search on the indexed columns, while the in-memory index is being built"""
+    kind, prefix = query_prefix(query)
+    if kind is None:
+        return []
+    column = Customer.mobile if kind == 'mobile' else Customer.name
+    rows = db.session.execute(
+        select(Customer.id, Customer.name, Customer.mobile)
+        .where(column.like(_like_prefix(prefix), escape='\\')).order_by(column).limit(limit)
+    )
+    return [{'id': row.id, 'name': row.name, 'mobile': row.mobile} for row in rows]
+
+
+def search_customers(query, limit=10):
+    """Customers whose name, a later name word or mobile starts with `query`: [{id, name, mobile}]"""
+    _sync()
+    if not index.built:
+        return _search_table(query, limit)
+    with index.lock:
+        # A few spare candidates in case some were deleted or archived since indexed
+        candidate_ids = index.search(query, limit + 5)
+    if not candidate_ids:
+        return []
+    rows = {row.id: row for row in db.session.execute(
+        select(Customer.id, Customer.name, Customer.mobile).where(Customer.id.in_(candidate_ids))
+    )}
+    missing = [customer_id for customer_id in candidate_ids if customer_id not in rows]
+    if missing:
+        with index.lock:
+            for customer_id in missing:
+                index.remove(customer_id)
+    return [{'id': row.id, 'name': row.name, 'mobile': row.mobile}
+            for row in (rows[customer_id] for customer_id in candidate_ids if customer_id in rows)][:limit]
+
+
+def _indexed(mapper, connection, target):
+    if index.built and index.pid == os.getpid():
+        with index.lock:
+            index.upsert(target.id, target.name, target.mobile)
+
+
+def _unindexed(mapper, connection, target):
+    if index.built and index.pid == os.getpid():
+        with index.lock:
+            index.remove(target.id)
+
+
+event.listen(Customer, 'after_insert', _indexed)
+event.listen(Customer, 'after_update', _indexed)
+event.listen(Customer, 'after_delete', _unindexed)
@@ -0,0 +1,94 @@
+"""
+Customer Timeline
+The customer profile shows appointments, transactions and loyalty entries as
+one newest-first timeline. A page of it is a single UNION ALL query over the
+three tables (each branch filtered by customer and already joined to staff
+and services), sorted and limited in the database, so the page costs the
+same for a customer with 2,000 visits as for one with 2. The summary at the
+top (entry counts) is one query of indexed COUNTs, plus the precomputed
+customer_segments row (visits, paid spend, last visit).
+"""
+import math
+from datetime import datetime
+
+from sqlalchemy import Float, Integer, String, func, literal, literal_column, null, select, union_all
+from sqlalchemy.sql.expression import type_coerce
+
+from models import db, Staff, Service, Appointment, AppointmentService, Transaction, LoyaltyHistory, CustomerSegment
+
+
+class TimelinePage:
+    """One page of timeline entries, with the attributes templates use on Flask-SQLAlchemy paginations"""
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = max(1, math.ceil(total / per_page))
+        self.has_prev = page > 1
+        self.has_next = page < self.pages
+        self.prev_num = page - 1 if self.has_prev else None
+        self.next_num = page + 1 if self.has_next else None
+
+
+def _entries(customer_id):
+    """UNION ALL of a customer's appointments, transactions and loyalty entries as uniform rows"""
+    def blank(type_):
+        return type_coerce(null(), type_)
+
+    appointments = select(
+        literal('appointment', String).label('kind'),
+        Appointment.id.label('id'),
+        Appointment.appointment_date.label('at'),
+        Appointment.status.label('status'),
+        Staff.name.label('title'),
+        func.group_concat(literal_column("services.name ORDER BY appointment_services.id SEPARATOR ', '")).label('detail'),
+        type_coerce(func.sum(AppointmentService.price), Float).label('amount'),
+        blank(Integer).label('points'),
+    ).select_from(Appointment).outerjoin(Staff, Staff.id == Appointment.staff_id).outerjoin(
+        AppointmentService, AppointmentService.appointment_id == Appointment.id
+    ).outerjoin(Service, Service.id == AppointmentService.service_id).where(
+        Appointment.customer_id == customer_id
+    ).group_by(Appointment.id, Staff.name)
+
+    transactions = select(
+        literal('transaction', String), Transaction.id, Transaction.created_at, Transaction.payment_status,
+        Transaction.invoice_number, Transaction.payment_method, Transaction.total_amount,
+        Transaction.loyalty_points_earned,
+    ).where(Transaction.customer_id == customer_id)
+
+    loyalty = select(
+        literal('loyalty', String), LoyaltyHistory.id, LoyaltyHistory.created_at, blank(String),
+        LoyaltyHistory.description, blank(String), blank(Float), LoyaltyHistory.points,
+    ).where(LoyaltyHistory.customer_id == customer_id)
+
+    return union_all(appointments, transactions, loyalty).subquery('timeline')
+
+
+def timeline_summary(customer_id):
+    """Entry counts (one query) and the customer's precomputed segment row (or None)"""
+    def count(model, *criteria):
+        return select(func.count()).select_from(model).where(model.customer_id == customer_id, *criteria).scalar_subquery()
+
+    counts = db.session.execute(select(
+        count(Appointment).label('appointments'),
+        count(Appointment, Appointment.status == 'scheduled',
+              Appointment.appointment_date >= datetime.now()).label('upcoming'),
+        count(Transaction).label('transactions'),
+        count(LoyaltyHistory).label('loyalty'),
+    )).one()._asdict()
+    counts['total'] = counts['appointments'] + counts['transactions'] + counts['loyalty']
+    return counts, db.session.get(CustomerSegment, customer_id)
+
+
+def timeline_page(customer_id, page, per_page, total):
+    """TimelinePage of entries (dicts: kind, id, at, status, title, detail, amount, points), newest first"""
+    pages = max(1, math.ceil(total / per_page))
+    page = min(max(page, 1), pages)
+    timeline = _entries(customer_id)
+    rows = db.session.execute(
+        select(timeline).order_by(timeline.c.at.desc(), timeline.c.kind, timeline.c.id.desc())
+        .limit(per_page).offset((page - 1) * per_page)
+    ).all() if total else []
+    return TimelinePage([row._asdict() for row in rows], page, per_page, total)
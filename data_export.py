@@ -0,0 +1,133 @@
+"""
+Data Exports (CSV / JSONL)
+Full exports of customers, appointments and transactions for accounting and
+BI tools. Each export is one joined query read from a server-side cursor and
+encoded STREAM_BATCH rows at a time (optionally gzip-compressed as it goes),
+so memory use does not depend on table size. Rows are ordered by id:
+- `start`/`end` (inclusive dates) filter on the dataset's date column
+- `since_id` exports only rows with a larger id, for incremental pulls
+  (remember the last id of the previous export)
+Archived customers are not in `customers`; their appointments and
+transactions are exported with empty customer name/mobile.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, literal_column, select
+
+from api_serializers import STREAM_BATCH, dumps
+from models import Customer, Staff, Service, Appointment, AppointmentService, Transaction
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def _customers():
+    return select(
+        Customer.id, Customer.name, Customer.mobile, Customer.email, Customer.address,
+        Customer.loyalty_points, Customer.total_spent, Customer.created_at, Customer.updated_at,
+    ), Customer.id, Customer.created_at
+
+
+def _appointments():
+    return select(
+        Appointment.id, Appointment.appointment_date, Appointment.status,
+        Appointment.customer_id, Customer.name.label('customer_name'), Customer.mobile.label('customer_mobile'),
+        Appointment.staff_id, Staff.name.label('staff_name'),
+        func.group_concat(literal_column("services.name ORDER BY appointment_services.id SEPARATOR ', '")).label('services'),
+        func.sum(AppointmentService.price).label('services_total'),
+        Appointment.notes, Appointment.created_at,
+    ).select_from(Appointment).outerjoin(
+        Customer, Customer.id == Appointment.customer_id
+    ).outerjoin(Staff, Staff.id == Appointment.staff_id).outerjoin(
+        AppointmentService, AppointmentService.appointment_id == Appointment.id
+    ).outerjoin(Service, Service.id == AppointmentService.service_id).group_by(
+        Appointment.id, Customer.name, Customer.mobile, Staff.name
+    ), Appointment.id, Appointment.appointment_date
+
+
+def _transactions():
+    return select(
+        Transaction.id, Transaction.invoice_number, Transaction.created_at,
+        Transaction.customer_id, Customer.name.label('customer_name'), Customer.mobile.label('customer_mobile'),
+        Transaction.appointment_id, Transaction.amount, Transaction.discount, Transaction.tax,
+        Transaction.total_amount, Transaction.payment_method, Transaction.payment_status,
+        Transaction.loyalty_points_earned, Transaction.loyalty_points_redeemed,
+    ).select_from(Transaction).outerjoin(
+        Customer, Customer.id == Transaction.customer_id
+    ), Transaction.id, Transaction.created_at
+
+
+DATASETS = {'customers': _customers, 'appointments': _appointments, 'transactions': _transactions}
+
+
+def export_query(dataset, start_date=None, end_date=None, since_id=None):
+    """Statement for a dataset (see DATASETS) with optional inclusive date range and id cursor"""
+    stmt, id_column, date_column = DATASETS[dataset]()
+    if start_date:
+        stmt = stmt.where(date_column >= datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        stmt = stmt.where(date_column < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    if since_id:
+        stmt = stmt.where(id_column > since_id)
+    return stmt.order_by(id_column)
+
+
+def iter_rows(session, stmt):
+    """Yield rows of `stmt` as dicts from a server-side cursor"""
+    result = session.execute(stmt.execution_options(yield_per=STREAM_BATCH))
+    for row in result:
+        yield row._asdict()
+
+
+def _batched(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= STREAM_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encode_csv(rows, columns):
+    """Yield a CSV document (header row first) as UTF-8 byte chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in _batched(rows):
+        writer.writerows([row[name] for name in columns] for row in batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')  # header only: no rows matched
+
+
+def encode_jsonl(rows):
+    """Yield one JSON object per line as byte chunks"""
+    for batch in _batched(rows):
+        yield b''.join(dumps(row) + b'\n' for row in batch)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a byte stream into a gzip stream on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(rows, columns, format, compress=False):
+    """Encode dict rows as `format` (csv or jsonl) byte chunks, gzipped if `compress`"""
+    chunks = encode_csv(rows, columns) if format == 'csv' else encode_jsonl(rows)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_columns(dataset):
+    """Output column names of a dataset, in order"""
+    return [column.name for column in DATASETS[dataset]()[0].selected_columns]
@@ -0,0 +1,96 @@
+"""
+Read/Write Session Routing
+Routes marked with @read_replica send their SELECTs to one of the configured
+read replicas (SQLALCHEMY_BINDS 'replica_<n>', built from DATABASE_REPLICA_URLS).
+Everything else stays on the primary:
+- INSERT/UPDATE/DELETE, flushes and SELECT ... FOR UPDATE
+- any read after this session has written or locked rows (read-your-writes
+  within a request)
+- requests from a browser that wrote within READ_AFTER_WRITE_SECONDS
+- requests overridden with ?db=primary or an `X-DB-Route: primary` header
+"""
+import random
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND_PREFIX = 'replica_'
+PRIMARY = 'primary'
+REPLICA = 'replica'
+_PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+
+def read_replica(view):
+    """Mark a view as read-only so its queries may be served by a replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_route = g.get('db_route_override') or REPLICA
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def use_primary():
+    """Force the rest of the current request onto the primary"""
+    g.db_route = PRIMARY
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that picks a replica engine for read-only requests"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._replica_allowed(clause):
+            engine = self._replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_allowed(self, clause):
+        if not has_request_context() or g.get('db_route') != REPLICA:
+            return False
+        if self._flushing or self.info.get('wrote') or self.new or self.dirty or self.deleted:
+            return False
+        if isinstance(clause, UpdateBase) or getattr(clause, '_for_update_arg', None) is not None:
+            # The request is writing (Core DML does not flush): keep its later reads on the primary too
+            use_primary()
+            return False
+        return True
+
+    def _replica_engine(self):
+        """Pick one replica per request so all its reads see the same snapshot"""
+        key = g.get('db_replica_key')
+        if key is None:
+            keys = [k for k in self._db.engines if k and k.startswith(REPLICA_BIND_PREFIX)]
+            if not keys:
+                return None
+            key = g.db_replica_key = random.choice(keys)
+        return self._db.engines[key]
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_session_wrote(session, flush_context):
+    session.info['wrote'] = True
+    if has_request_context():
+        g.db_wrote = True
+
+
+def init_db_routing(app):
+    """Register request hooks for overrides and read-after-write stickiness"""
+
+    @app.before_request
+    def _select_route():
+        override = (request.args.get('db') or request.headers.get('X-DB-Route') or '').lower()
+        if override in (PRIMARY, REPLICA):
+            g.db_route_override = override
+        elif http_session.get(_PRIMARY_UNTIL_KEY, 0) > time.time():
+            # This browser wrote recently; replicas may not have caught up yet
+            g.db_route_override = PRIMARY
+
+    @app.after_request
+    def _remember_write(response):
+        if g.get('db_wrote'):
+            http_session[_PRIMARY_UNTIL_KEY] = time.time() + current_app.config['READ_AFTER_WRITE_SECONDS']
+        return response
@@ -0,0 +1,121 @@
+"""
+Finance Analytics
+Revenue totals, counts, discount and tax sums computed in MySQL with a single
+aggregated query per view, optionally grouped by day/week/month, payment
+method, staff or service. Nothing here loads Transaction rows into Python.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, distinct, func
+
+from models import db, Transaction, Appointment, AppointmentService, Service, Staff
+
+PERIODS = ('day', 'week', 'month', 'year')
+GROUPINGS = ('day', 'week', 'month', 'payment_method', 'staff', 'service')
+
+
+def period_range(period, today=None):
+    """Return (start_date, end_date) inclusive for a finance period name"""
+    today = today or datetime.now().date()
+    if period == 'day':
+        return today, today
+    if period == 'week':
+        return today - timedelta(days=7), today
+    if period == 'month':
+        return today.replace(day=1), today
+    return today.replace(month=1, day=1), today
+
+
+def created_between(start_date, end_date):
+    """Index-friendly filter on Transaction.created_at for an inclusive date range"""
+    start = datetime.combine(start_date, datetime.min.time())
+    end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    return (Transaction.created_at >= start, Transaction.created_at < end)
+
+
+def _paid(column):
+    return func.coalesce(func.sum(case((Transaction.payment_status == 'paid', column), else_=0)), 0)
+
+
+def _transaction_metrics():
+    return [
+        func.count(Transaction.id).label('transactions'),
+        _paid(Transaction.total_amount).label('revenue'),
+        func.coalesce(func.sum(Transaction.amount), 0).label('amount'),
+        func.coalesce(func.sum(Transaction.discount), 0).label('discount'),
+        func.coalesce(func.sum(Transaction.tax), 0).label('tax'),
+    ]
+
+
+def _row_to_dict(row):
+    data = dict(row._mapping)
+    for key in ('revenue', 'amount', 'discount', 'tax'):
+        if data.get(key) is not None:
+            data[key] = float(data[key])
+    return data
+
+
+def totals(start_date, end_date):
+    """Period totals: transactions, revenue (paid), amount, discount, tax"""
+    row = db.session.query(*_transaction_metrics()).filter(*created_between(start_date, end_date)).one()
+    return _row_to_dict(row)
+
+
+def grouped(start_date, end_date, group_by):
+    """Per-group metrics for the period, as a list of dicts with 'key' and 'label'"""
+    if group_by not in GROUPINGS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+    date_filter = created_between(start_date, end_date)
+
+    if group_by == 'service':
+        # Service revenue is the pre-discount, pre-tax line price of each service sold
+        key = Service.id
+        label = Service.name
+        query = db.session.query(
+            key.label('key'), label.label('label'),
+            func.count(distinct(Transaction.id)).label('transactions'),
+            _paid(AppointmentService.price).label('revenue'),
+        ).join(
+            AppointmentService, AppointmentService.appointment_id == Transaction.appointment_id
+        ).join(Service, Service.id == AppointmentService.service_id)
+        rows = query.filter(*date_filter).group_by(key, label).order_by(label).all()
+        return [_row_to_dict(row) for row in rows]
+
+    if group_by == 'staff':
+        key = Staff.id
+        label = func.coalesce(Staff.name, 'Unassigned')
+        query = db.session.query(key.label('key'), label.label('label'), *_transaction_metrics()).outerjoin(
+            Appointment, Appointment.id == Transaction.appointment_id
+        ).outerjoin(Staff, Staff.id == Appointment.staff_id)
+        rows = query.filter(*date_filter).group_by(key, Staff.name).order_by(Staff.name).all()
+        return [_row_to_dict(row) for row in rows]
+
+    if group_by == 'payment_method':
+        key = label = Transaction.payment_method
+    elif group_by == 'day':
+        key = label = func.date(Transaction.created_at)
+    elif group_by == 'week':
+        key = label = func.date_format(Transaction.created_at, '%x-W%v')  # ISO year-week
+    else:
+        key = label = func.date_format(Transaction.created_at, '%Y-%m')
+
+    rows = db.session.query(
+        key.label('key'), label.label('label'), *_transaction_metrics()
+    ).filter(*date_filter).group_by(key).order_by(key).all()
+    return [_row_to_dict(row) for row in rows]
+
+
+def summary(start_date, end_date, group_by=None):
+    """Totals plus optional groups, JSON-serializable"""
+    result = {
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'totals': totals(start_date, end_date),
+    }
+    if group_by:
+        result['group_by'] = group_by
+        result['groups'] = [
+            {**group, 'key': str(group['key']) if group['key'] is not None else None}
+            for group in grouped(start_date, end_date, group_by)
+        ]
+    return result
@@ -1,8 +1,10 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, TextAreaField, FloatField, IntegerField, SelectField, DateTimeField, BooleanField, PasswordField
 from wtforms.validators import DataRequired, Email, Optional, NumberRange
-from wtforms.widgets import CheckboxInput, ListWidget
+from wtforms.widgets import CheckboxInput, HiddenInput, ListWidget
 from wtforms.fields import SelectMultipleField
+from segments import AUDIENCES
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
@@ -15,8 +17,13 @@ class CustomerForm(FlaskForm):
     mobile = StringField('Mobile Number', validators=[DataRequired()])
     address = TextAreaField('Address', validators=[Optional()])
 
+class CustomerImportForm(FlaskForm):
+    file = FileField('Customer File (.csv or .xlsx)', validators=[FileRequired(), FileAllowed(['csv', 'xlsx'], 'Upload a .csv or .xlsx file')])
+    update_existing = BooleanField('Update customers whose mobile already exists', default=True)
+
 class AppointmentForm(FlaskForm):
-    customer_id = SelectField('Customer', coerce=int, validators=[DataRequired()])
+    # Filled in by the typeahead picker (see customer_search.py); only the submitted id is validated
+    customer_id = IntegerField('Customer', widget=HiddenInput(), validators=[DataRequired('Choose a customer from the search results')])
     staff_id = SelectField('Staff', coerce=int, validators=[DataRequired()])
     appointment_date = DateTimeField('Appointment Date & Time', validators=[DataRequired()], format='%Y-%m-%dT%H:%M')
     service_ids = SelectMultipleField('Services', coerce=int, validators=[DataRequired()])
@@ -42,8 +49,6 @@ class PromotionForm(FlaskForm):
     start_date = DateTimeField('Start Date', validators=[DataRequired()], format='%Y-%m-%dT%H:%M')
     end_date = DateTimeField('End Date', validators=[DataRequired()], format='%Y-%m-%dT%H:%M')
     target_audience = SelectField('Target Audience', 
-                                 choices=[('all', 'All Customers'), 
-                                         ('new_customers', 'New Customers'), 
-                                         ('loyal_customers', 'Loyal Customers')],
+                                 choices=AUDIENCES,
                                  validators=[DataRequired()])
 
@@ -0,0 +1,55 @@
+"""
+Gunicorn configuration for production serving
+Start:   gunicorn -c gunicorn.conf.py wsgi:app
+Reload:  scripts/graceful_reload.sh   (zero-downtime, re-imports the app)
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND') or '0.0.0.0:8000'
+pidfile = os.environ.get('GUNICORN_PIDFILE') or 'gunicorn.pid'
+
+# Preforked processes plus threads: processes scale across cores, threads cover
+# requests that mostly wait on MySQL or the WhatsApp API.
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+# Recycle workers to bound memory growth; jitter avoids all workers restarting at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS') or 1000)
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER') or 100)
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 30)
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT') or 30)
+keepalive = 5
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Drop pooled DB connections inherited from the master; each worker opens its own"""
+    from wsgi import app
+    from models import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def when_ready(server):
+    """Build the customer search index in the master, so every worker (and recycled worker) forks with it"""
+    from wsgi import app
+    from models import db
+    import customer_search
+
+    with app.app_context():
+        try:
+            customer_search.build_index()
+        except Exception as e:
+            server.log.warning('Customer search index not prebuilt (workers build it in the background): %s', e)
+        for engine in db.engines.values():
+            engine.dispose()
@@ -0,0 +1,67 @@
+"""
+Invoice Number Allocator
+Hands out collision-free invoice numbers of the form INV[-<branch>]-<YYYYMMDD>-<seq>.
+Each worker process reserves a block of sequence numbers per prefix from the
+invoice_sequences counter table in one atomic statement, then serves numbers
+from memory until the block is used up. Numbers are unique but not gapless:
+the unused tail of a block is skipped when a worker restarts.
+"""
+import os
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.dialects.mysql import insert
+
+from models import db, InvoiceSequence
+
+
+class InvoiceNumberAllocator:
+    """Thread-safe, per-process block allocator backed by InvoiceSequence"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._blocks = {}  # prefix -> [next_value, end_value)
+
+    def prefix_for(self, when=None):
+        """Invoice prefix for a day (and optional branch code)"""
+        when = when or datetime.now()
+        branch = current_app.config.get('INVOICE_BRANCH_CODE')
+        parts = ['INV'] + ([branch] if branch else []) + [when.strftime('%Y%m%d')]
+        return '-'.join(parts)
+
+    def next_number(self, when=None):
+        """Return the next unique invoice number"""
+        prefix = self.prefix_for(when)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Blocks reserved before a fork must not be shared with the child
+                self._pid = os.getpid()
+                self._blocks = {}
+            block = self._blocks.get(prefix)
+            if block is None or block[0] >= block[1]:
+                block_size = current_app.config.get('INVOICE_BLOCK_SIZE', 20)
+                start = self._reserve_block(prefix, block_size)
+                # Only the current day's prefix is ever needed again
+                self._blocks = {prefix: [start, start + block_size]}
+                block = self._blocks[prefix]
+            value = block[0]
+            block[0] += 1
+        return f"{prefix}-{value:05d}"
+
+    def _reserve_block(self, prefix, block_size):
+        """Atomically advance the counter for `prefix` by `block_size`; return the block start"""
+        # A separate connection commits the reservation independently of the
+        # caller's session, so a rolled-back checkout never reuses a number.
+        table = InvoiceSequence.__table__
+        stmt = insert(table).values(prefix=prefix, next_value=func.last_insert_id(1 + block_size))
+        stmt = stmt.on_duplicate_key_update(next_value=func.last_insert_id(table.c.next_value + block_size))
+        with db.engine.begin() as conn:
+            conn.execute(stmt)
+            next_value = conn.execute(select(func.last_insert_id())).scalar()
+        return next_value - block_size
+
+
+invoice_allocator = InvoiceNumberAllocator()
@@ -0,0 +1,87 @@
+"""
+Inbound WhatsApp Message Deduplication
+Providers redeliver a webhook when it times out, and a redelivered "1" or
+"yes" would otherwise advance a booking twice. Provider message ids are
+claimed before a message is queued:
+- ids seen recently by this process are answered from a bounded in-memory LRU
+- otherwise one INSERT IGNORE into processed_messages (a primary key probe)
+  decides, atomically across processes, whether the id is new
+A message whose processing fails releases its id so the provider's retry is
+handled. Ids older than WHATSAPP_DEDUP_TTL_HOURS are purged by
+`flask --app app prune-conversations`.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, insert, select
+
+from models import db, ProcessedMessage
+
+
+class RecentIds:
+    """Thread-safe, bounded LRU set of message ids"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = OrderedDict()
+
+    def __contains__(self, message_id):
+        with self._lock:
+            if message_id not in self._ids:
+                return False
+            self._ids.move_to_end(message_id)
+            return True
+
+    def add(self, message_id, max_size):
+        with self._lock:
+            self._ids[message_id] = None
+            self._ids.move_to_end(message_id)
+            while len(self._ids) > max_size:
+                self._ids.popitem(last=False)
+
+    def discard(self, message_id):
+        with self._lock:
+            self._ids.pop(message_id, None)
+
+
+recent_ids = RecentIds()
+
+
+def claim_message(message_id):
+    """True the first time a provider message id is seen, False for redeliveries"""
+    if message_id in recent_ids:
+        return False
+    table = ProcessedMessage.__table__
+    with db.engine.begin() as connection:
+        inserted = connection.execute(
+            insert(table).prefix_with('IGNORE').values(message_id=message_id, received_at=datetime.utcnow())
+        ).rowcount
+    recent_ids.add(message_id, current_app.config['WHATSAPP_DEDUP_CACHE_SIZE'])
+    return inserted == 1
+
+
+def release_message(message_id):
+    """Forget a claimed id (its processing failed) so a redelivery is handled"""
+    recent_ids.discard(message_id)
+    with db.engine.begin() as connection:
+        connection.execute(delete(ProcessedMessage.__table__).where(ProcessedMessage.message_id == message_id))
+
+
+def purge_processed_messages(now=None):
+    """Delete message ids older than WHATSAPP_DEDUP_TTL_HOURS; returns rows deleted"""
+    table = ProcessedMessage.__table__
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=current_app.config['WHATSAPP_DEDUP_TTL_HOURS'])
+    batch_size = current_app.config['CONVERSATION_BATCH_SIZE']
+    purged = 0
+    while True:
+        ids = db.session.scalars(
+            select(table.c.message_id).where(table.c.received_at < cutoff)
+            .order_by(table.c.received_at).limit(batch_size)
+        ).all()
+        if not ids:
+            return purged
+        db.session.execute(delete(table).where(table.c.message_id.in_(ids)))
+        db.session.commit()
+        purged += len(ids)
@@ -2,8 +2,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from db_routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -24,19 +25,36 @@ class User(UserMixin, db.Model):
 class Customer(db.Model):
     __tablename__ = 'customers'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)  # typeahead prefix search before its index is built
     email = db.Column(db.String(120))
-    mobile = db.Column(db.String(20), nullable=False)
+    mobile = db.Column(db.String(20), nullable=False, index=True)
     address = db.Column(db.Text)
-    loyalty_points = db.Column(db.Integer, default=0)
+    loyalty_points = db.Column(db.Integer, default=0, index=True)
     total_spent = db.Column(db.Float, default=0.0)
     is_archived = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # typeahead sync
     
-    appointments = db.relationship('Appointment', backref='customer', lazy=True, cascade='all, delete-orphan')
-    transactions = db.relationship('Transaction', backref='customer', lazy=True)
-    loyalty_history = db.relationship('LoyaltyHistory', backref='customer', lazy=True)
+    # History tables keep customer_id without a foreign key, so it survives archiving (see archive.py)
+    appointments = db.relationship('Appointment', backref='customer', lazy=True, cascade='all, delete-orphan',
+                                   primaryjoin='Customer.id == foreign(Appointment.customer_id)')
+    transactions = db.relationship('Transaction', backref='customer', lazy=True,
+                                   primaryjoin='Customer.id == foreign(Transaction.customer_id)')
+    loyalty_history = db.relationship('LoyaltyHistory', backref='customer', lazy=True,
+                                      primaryjoin='Customer.id == foreign(LoyaltyHistory.customer_id)')
+    segment = db.relationship('CustomerSegment', backref='customer', uselist=False, lazy=True, cascade='all, delete-orphan')
+
+class CustomerSegment(db.Model):
+    __tablename__ = 'customer_segments'
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), primary_key=True)
+    last_visit = db.Column(db.DateTime, index=True)
+    visit_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    monetary = db.Column(db.Float, nullable=False, default=0.0)  # paid spend
+    recency_score = db.Column(db.SmallInteger, nullable=False, default=1)  # 1-5, as of updated_at
+    frequency_score = db.Column(db.SmallInteger, nullable=False, default=1)  # 1-5
+    monetary_score = db.Column(db.SmallInteger, nullable=False, default=1, index=True)  # 1-5
+    segment = db.Column(db.String(30), index=True)  # champions, loyal, new, promising, at_risk, lost, regular
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Service(db.Model):
     __tablename__ = 'services'
@@ -61,10 +79,22 @@ class Staff(db.Model):
     appointments = db.relationship('Appointment', backref='staff', lazy=True)
     attendance = db.relationship('Attendance', backref='staff', lazy=True)
 
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_versions'
+    name = db.Column(db.String(30), primary_key=True)  # services, staff
+    version = db.Column(db.Integer, nullable=False, default=0)  # bumped on every insert/update/delete
+
+class StaffWeeklyStats(db.Model):
+    __tablename__ = 'staff_weekly_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    week_start = db.Column(db.Date, nullable=False, unique=True)  # Monday
+    data = db.Column(db.Text, nullable=False)  # JSON occupancy results for the week
+    computed_at = db.Column(db.DateTime, default=datetime.now)  # local time, like appointment_date
+
 class Appointment(db.Model):
     __tablename__ = 'appointments'
     id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
+    customer_id = db.Column(db.Integer, nullable=False)  # customers.id, or customers_archive.id once archived
     staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
     appointment_date = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(20), default='scheduled')  # scheduled, completed, cancelled, no-show
@@ -74,6 +104,10 @@ class Appointment(db.Model):
     
     services = db.relationship('AppointmentService', backref='appointment', lazy=True, cascade='all, delete-orphan')
     transaction = db.relationship('Transaction', backref='appointment', uselist=False)
+    
+    __table_args__ = (
+        db.Index('ix_appointments_customer_date', 'customer_id', 'appointment_date'),  # customer timeline
+    )
 
 class AppointmentService(db.Model):
     __tablename__ = 'appointment_services'
@@ -87,7 +121,7 @@ class AppointmentService(db.Model):
 class Transaction(db.Model):
     __tablename__ = 'transactions'
     id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
+    customer_id = db.Column(db.Integer, nullable=False)  # customers.id, or customers_archive.id once archived
     appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=True)
     amount = db.Column(db.Float, nullable=False)
     discount = db.Column(db.Float, default=0.0)
@@ -100,19 +134,44 @@ class Transaction(db.Model):
     invoice_number = db.Column(db.String(50), unique=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_transactions_customer_created', 'customer_id', 'created_at'),  # customer timeline
+    )
+    
     @staticmethod
     def generate_invoice_number():
-        from datetime import datetime
-        return f"INV-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        from invoice_numbers import invoice_allocator
+        return invoice_allocator.next_number()
+
+class InvoiceSequence(db.Model):
+    __tablename__ = 'invoice_sequences'
+    prefix = db.Column(db.String(40), primary_key=True)  # e.g. INV-20250118 or INV-BR1-20250118
+    next_value = db.Column(db.Integer, nullable=False, default=1)  # first number not yet reserved
 
 class LoyaltyHistory(db.Model):
     __tablename__ = 'loyalty_history'
     id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
+    customer_id = db.Column(db.Integer, nullable=False)  # customers.id, or customers_archive.id once archived
     transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=True)
     points = db.Column(db.Integer, nullable=False)  # positive for earned, negative for redeemed
     description = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    transaction = db.relationship('Transaction')
+    
+    __table_args__ = (
+        db.Index('ix_loyalty_history_customer_created', 'customer_id', 'created_at'),  # customer timeline
+    )
+
+class CheckoutRequest(db.Model):
+    __tablename__ = 'checkout_requests'
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(64), unique=True, nullable=False)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=True)  # null for batch checkouts
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    transaction = db.relationship('Transaction')
 
 class Attendance(db.Model):
     __tablename__ = 'attendance'
@@ -135,30 +194,41 @@ class Promotion(db.Model):
     discount_value = db.Column(db.Float, nullable=False)
     start_date = db.Column(db.DateTime, nullable=False)
     end_date = db.Column(db.DateTime, nullable=False)
-    target_audience = db.Column(db.String(50), default='all')  # all, new_customers, loyal_customers
+    target_audience = db.Column(db.String(50), default='all')  # see segments.AUDIENCES
     sent_via_whatsapp = db.Column(db.Boolean, default=False)
     sent_via_email = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     campaign_stats = db.relationship('CampaignStats', backref='promotion', lazy=True)
+    counters = db.relationship('PromotionCounters', uselist=False, lazy=True)
 
 class CampaignStats(db.Model):
     __tablename__ = 'campaign_stats'
     id = db.Column(db.Integer, primary_key=True)
     promotion_id = db.Column(db.Integer, db.ForeignKey('promotions.id'), nullable=False)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=True)
+    customer_id = db.Column(db.Integer, nullable=True, index=True)  # customers.id, or customers_archive.id once archived
     message_opened = db.Column(db.Boolean, default=False)
+    open_count = db.Column(db.Integer, nullable=False, default=0)  # every open/click, repeats included
     offer_redeemed = db.Column(db.Boolean, default=False)
     sent_at = db.Column(db.DateTime, default=datetime.utcnow)
     opened_at = db.Column(db.DateTime)
     redeemed_at = db.Column(db.DateTime)
 
+class PromotionCounters(db.Model):
+    __tablename__ = 'promotion_counters'
+    promotion_id = db.Column(db.Integer, db.ForeignKey('promotions.id'), primary_key=True)
+    sent = db.Column(db.Integer, nullable=False, default=0)
+    opened = db.Column(db.Integer, nullable=False, default=0)  # unique recipients who opened
+    open_events = db.Column(db.Integer, nullable=False, default=0)  # every open/click, repeats included
+    redeemed = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class WhatsAppConversation(db.Model):
     __tablename__ = 'whatsapp_conversations'
     id = db.Column(db.Integer, primary_key=True)
-    phone_number = db.Column(db.String(20), nullable=False, index=True)
-    step = db.Column(db.String(50), default='start')  # start, name, mobile, staff, date, services, notes, confirm
+    phone_number = db.Column(db.String(20), nullable=False)
+    step = db.Column(db.String(50), default='start')  # start, name, mobile, staff, date, services, notes, confirm, completed, expired
     data = db.Column(db.Text)  # JSON string to store collected data
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=True)
     appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=True)
@@ -168,4 +238,69 @@ class WhatsAppConversation(db.Model):
     
     customer = db.relationship('Customer', backref='whatsapp_conversations')
     appointment = db.relationship('Appointment', backref='whatsapp_conversations')
+    
+    __table_args__ = (
+        db.Index('ix_whatsapp_conversations_phone_active', 'phone_number', 'is_active'),  # active conversation lookup
+        db.Index('ix_whatsapp_conversations_active_updated', 'is_active', 'updated_at'),  # retention job scans
+    )
+
+class ConversationDailyStats(db.Model):
+    __tablename__ = 'conversation_daily_stats'
+    day = db.Column(db.Date, primary_key=True)  # conversation start date
+    conversations = db.Column(db.Integer, nullable=False, default=0)
+    booked = db.Column(db.Integer, nullable=False, default=0)
+    expired = db.Column(db.Integer, nullable=False, default=0)
+
+class ProcessedMessage(db.Model):
+    __tablename__ = 'processed_messages'
+    message_id = db.Column(db.String(128), primary_key=True)  # provider message id (wamid..., Twilio SID)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+# Cold storage for archived customers (see archive.py). Same columns and ids as
+# the hot tables plus archived_at; no foreign keys so rows can move freely.
+class ArchivedCustomer(db.Model):
+    __tablename__ = 'customers_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(120))
+    mobile = db.Column(db.String(20), nullable=False, index=True)
+    address = db.Column(db.Text)
+    loyalty_points = db.Column(db.Integer, default=0)
+    total_spent = db.Column(db.Float, default=0.0)
+    is_archived = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ArchivedAppointment(db.Model):
+    __tablename__ = 'appointments_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    customer_id = db.Column(db.Integer, nullable=False, index=True)
+    staff_id = db.Column(db.Integer, nullable=False)
+    appointment_date = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20))
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ArchivedAppointmentService(db.Model):
+    __tablename__ = 'appointment_services_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    appointment_id = db.Column(db.Integer, nullable=False, index=True)
+    service_id = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class ArchivedConversation(db.Model):
+    __tablename__ = 'whatsapp_conversations_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    phone_number = db.Column(db.String(20), nullable=False)
+    step = db.Column(db.String(50))
+    data = db.Column(db.Text)
+    customer_id = db.Column(db.Integer, index=True)
+    appointment_id = db.Column(db.Integer)
+    is_active = db.Column(db.Boolean)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,172 @@
+"""
+N+1 and Slow Query Detector
+Fingerprints every SQL statement issued during a request, flags repeated
+identical-shape queries (typically lazy relationship loads) together with the
+Python/template code that triggered them, and logs slow statements with their
+EXPLAIN plan. In test mode, budget violations raise instead of logging.
+"""
+import os
+import re
+import threading
+import time
+import traceback
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from models import db
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s|%\(\w+\)s)\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in test mode when a request exceeds its query budget or triggers an N+1"""
+
+
+def fingerprint(statement):
+    """Reduce a SQL statement to its shape (literals and IN-lists collapsed)"""
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def _caller_frames(limit=6):
+    """Return the innermost project frames (Python files and templates) for the current query"""
+    frames = []
+    lazy = False
+    for frame in traceback.extract_stack()[:-3]:
+        filename = frame.filename
+        if 'sqlalchemy' in filename and filename.endswith(os.path.join('orm', 'strategies.py')):
+            lazy = True
+        if filename.endswith('.html'):
+            frames.append(f"template {os.path.relpath(filename, PROJECT_ROOT)}")
+        elif filename.startswith(PROJECT_ROOT) and filename != __file__ and 'site-packages' not in filename:
+            frames.append(f"{os.path.relpath(filename, PROJECT_ROOT)}:{frame.lineno} in {frame.name}")
+    return frames[-limit:], lazy
+
+
+class RequestQueryLog:
+    """Queries recorded for a single request"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = defaultdict(list)  # fingerprint -> [(duration_ms, frames, lazy)]
+        self.slow = []  # (duration_ms, statement, parameters, frames, engine)
+
+    def record(self, engine, statement, parameters, duration_ms, slow_threshold_ms):
+        frames, lazy = _caller_frames()
+        self.count += 1
+        self.total_ms += duration_ms
+        self.shapes[fingerprint(statement)].append((duration_ms, frames, lazy))
+        if duration_ms >= slow_threshold_ms:
+            # Keep the engine the statement ran on so EXPLAIN uses the same bind (replica or primary)
+            self.slow.append((duration_ms, statement, parameters, frames, engine))
+
+    def repeated(self, threshold):
+        """Return [(fingerprint, occurrences)] for shapes executed at least `threshold` times"""
+        return [(shape, hits) for shape, hits in self.shapes.items() if len(hits) >= threshold]
+
+
+def _current_log():
+    if not has_request_context():
+        return None
+    return g.get('_query_log')
+
+
+def _explain(engine, statement, parameters):
+    """Run EXPLAIN for a statement on a separate connection; returns printable rows"""
+    if not statement.lstrip().upper().startswith('SELECT'):
+        return []
+    _local.explaining = True
+    try:
+        with engine.connect() as conn:
+            result = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            columns = list(result.keys())
+            return [dict(zip(columns, row)) for row in result]
+    except Exception as e:
+        return [{'error': str(e)}]
+    finally:
+        _local.explaining = False
+
+
+def _install_listeners(app, engine):
+    slow_threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS', 200)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_query_start'].pop()
+        if getattr(_local, 'explaining', False):
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        log = _current_log()
+        if log is not None:
+            log.record(conn.engine, statement, parameters, duration_ms, slow_threshold_ms)
+        elif duration_ms >= slow_threshold_ms:
+            # Outside a request (CLI, scripts): report slow statements immediately
+            app.logger.warning("Slow query (%.1f ms): %s\nEXPLAIN: %s",
+                               duration_ms, statement, _explain(conn.engine, statement, parameters))
+
+
+def _report(app, log):
+    """Log N+1 candidates and slow queries; return a list of budget violations"""
+    endpoint = request.endpoint or request.path
+    violations = []
+
+    for shape, hits in log.repeated(app.config.get('QUERY_REPEAT_THRESHOLD', 5)):
+        lazy = any(hit[2] for hit in hits)
+        origin = '\n    '.join(hits[-1][1]) or '(unknown)'
+        message = (f"{'N+1 (lazy load)' if lazy else 'Repeated query'} on {endpoint}: "
+                   f"{len(hits)}x {shape}\n  triggered from:\n    {origin}")
+        app.logger.warning(message)
+        if lazy:
+            violations.append(message)
+
+    for duration_ms, statement, parameters, frames, engine in log.slow:
+        plan = _explain(engine, statement, parameters)
+        app.logger.warning("Slow query on %s (%.1f ms): %s\n  from: %s\n  EXPLAIN: %s",
+                           endpoint, duration_ms, statement, ' <- '.join(reversed(frames)), plan)
+
+    budget = app.config.get('QUERY_BUDGETS', {}).get(request.endpoint) or app.config.get('QUERY_BUDGET_DEFAULT')
+    if budget and log.count > budget:
+        violations.append(f"{endpoint} ran {log.count} queries (budget {budget})")
+    return violations
+
+
+def init_query_detector(app):
+    """Attach the detector to every engine of the app if QUERY_DETECTOR_ENABLED is set"""
+    if not app.config.get('QUERY_DETECTOR_ENABLED'):
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            _install_listeners(app, engine)
+
+    @app.before_request
+    def _start_query_log():
+        g._query_log = RequestQueryLog()
+
+    @app.after_request
+    def _check_query_log(response):
+        log = g.pop('_query_log', None)
+        if log is None:
+            return response
+        response.headers['X-Query-Count'] = str(log.count)
+        response.headers['X-Query-Time-Ms'] = f"{log.total_ms:.1f}"
+        violations = _report(app, log)
+        if violations and (app.testing or app.config.get('QUERY_DETECTOR_RAISE')):
+            raise QueryBudgetExceeded('\n'.join(violations))
+        return response
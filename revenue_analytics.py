@@ -0,0 +1,107 @@
+"""
+Revenue Trend Analytics
+Daily revenue as dense NumPy arrays with fixed-bucket series, rolling averages,
+week-over-week deltas and a seasonal (day-of-week) forecast. The series
+functions are vectorized over the last axis, so they work on one salon's
+series (days,) or many branches at once (branches, days).
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+import finance_analytics
+
+WEEK = 7
+
+
+def daily_revenue(start_date, end_date):
+    """Return (dates, revenue) for every day in [start_date, end_date], zero-filled"""
+    days = (end_date - start_date).days + 1
+    dates = np.arange(np.datetime64(start_date, 'D'), np.datetime64(start_date, 'D') + days)
+    revenue = np.zeros(days)
+    rows = finance_analytics.grouped(start_date, end_date, 'day')
+    if rows:
+        keys = np.array([np.datetime64(row['key'], 'D') for row in rows])
+        revenue[(keys - dates[0]).astype(int)] = [row['revenue'] for row in rows]
+    return dates, revenue
+
+
+def bucket_sums(values, size):
+    """Sum consecutive fixed-size buckets along the last axis, ending at the last value; a leading partial bucket is dropped"""
+    buckets = values.shape[-1] // size
+    trimmed = values[..., values.shape[-1] - buckets * size:]
+    return trimmed.reshape(*values.shape[:-1], buckets, size).sum(axis=-1)
+
+
+def rolling_mean(values, window):
+    """Trailing moving average along the last axis; the first window-1 points are NaN"""
+    result = np.full(values.shape, np.nan)
+    if values.shape[-1] < window:
+        return result
+    cumulative = np.cumsum(values, axis=-1)
+    sums = cumulative[..., window - 1:].copy()
+    sums[..., 1:] -= cumulative[..., :-window]
+    result[..., window - 1:] = sums / window
+    return result
+
+
+def week_over_week(values):
+    """Change versus the same weekday one week earlier; the first week is NaN"""
+    result = np.full(values.shape, np.nan)
+    result[..., WEEK:] = values[..., WEEK:] - values[..., :-WEEK]
+    return result
+
+
+def seasonal_forecast(values, horizon, weeks=4):
+    """Forecast `horizon` days ahead from the day-of-week profile of the last `weeks` weeks plus linear drift"""
+    history = values[..., -weeks * WEEK:]
+    weeks = history.shape[-1] // WEEK
+    if weeks == 0:
+        return np.zeros((*values.shape[:-1], horizon))
+    history = history[..., history.shape[-1] - weeks * WEEK:]
+    by_week = history.reshape(*history.shape[:-1], weeks, WEEK)
+    profile = by_week.mean(axis=-2)
+    # Daily drift from the change between the first and last week of the window
+    drift = (by_week[..., -1, :].mean(axis=-1) - by_week[..., 0, :].mean(axis=-1)) / max((weeks - 1) * WEEK, 1)
+    steps = np.arange(1, horizon + 1)
+    positions = np.arange(horizon) % WEEK
+    # Each profile value is the level at its weekday's mean position in the window,
+    # (weeks - 1) * WEEK / 2 days after that weekday's first occurrence
+    offset = (weeks * WEEK - 1 + steps) - (positions + (weeks - 1) * WEEK / 2)
+    seasonal = np.take(profile, positions, axis=-1)
+    return np.maximum(seasonal + drift[..., None] * offset, 0)
+
+
+def _json_series(values):
+    return [None if np.isnan(v) else round(float(v), 2) for v in values]
+
+
+def revenue_trend(days=180, today=None):
+    """JSON-ready revenue series, moving averages, WoW deltas and next-month projection"""
+    today = today or date.today()
+    start_date = today - timedelta(days=days - 1)
+    dates, revenue = daily_revenue(start_date, today)
+
+    next_month_start = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+    next_month_end = (next_month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    horizon = (next_month_end - today).days
+    forecast = seasonal_forecast(revenue, horizon)
+    forecast_dates = dates[-1] + np.arange(1, horizon + 1)
+    in_next_month = forecast_dates >= np.datetime64(next_month_start, 'D')
+
+    return {
+        'dates': [str(d) for d in dates],
+        'revenue': _json_series(revenue),
+        'moving_average_7': _json_series(rolling_mean(revenue, 7)),
+        'moving_average_30': _json_series(rolling_mean(revenue, 30)),
+        'week_over_week': _json_series(week_over_week(revenue)),
+        'weekly_totals': _json_series(bucket_sums(revenue, WEEK)),
+        'forecast': {
+            'dates': [str(d) for d in forecast_dates],
+            'revenue': _json_series(forecast),
+        },
+        'next_month': {
+            'month': next_month_start.strftime('%Y-%m'),
+            'projected_revenue': round(float(forecast[in_next_month].sum()), 2),
+        },
+    }
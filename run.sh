@@ -4,6 +4,9 @@ echo ""
 echo "Installing dependencies..."
 pip install -r requirements.txt
 echo ""
-echo "Starting server..."
+if [ "$1" = "prod" ]; then
+    echo "Starting production server (gunicorn)..."
+    exec gunicorn -c gunicorn.conf.py wsgi:app
+fi
+echo "Starting development server..."
 python app.py
-
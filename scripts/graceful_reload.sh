@@ -0,0 +1,26 @@
+#!/bin/bash
+# Zero-downtime reload for gunicorn with preload_app enabled.
+# HUP would only restart workers from the already-imported app, so instead
+# start a new master (USR2), let it boot, then retire the old one.
+set -e
+PIDFILE=${GUNICORN_PIDFILE:-gunicorn.pid}
+OLD_PID=$(cat "$PIDFILE")
+
+kill -USR2 "$OLD_PID"
+
+# The new master writes $PIDFILE once it is up; the old pid moves to $PIDFILE.oldbin
+for _ in $(seq 1 60); do
+    if [ -f "$PIDFILE" ] && [ "$(cat "$PIDFILE")" != "$OLD_PID" ]; then
+        break
+    fi
+    sleep 1
+done
+if [ "$(cat "$PIDFILE")" = "$OLD_PID" ]; then
+    echo "New master did not start; old master left running." >&2
+    exit 1
+fi
+
+# Stop the old workers, then the old master once in-flight requests finish
+kill -WINCH "$OLD_PID"
+kill -QUIT "$OLD_PID"
+echo "Reloaded: $OLD_PID -> $(cat "$PIDFILE")"
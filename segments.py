@@ -0,0 +1,122 @@
+"""
+Customer RFM Segments
+customer_segments holds per-customer recency/frequency/monetary scores, last
+visit and visit count, so promotion audiences are indexed lookups instead of
+scans over every customer at send time.
+- Checkout refreshes the affected customers in the same database transaction.
+- `flask --app app rebuild-segments` recomputes everyone in chunks (run it
+  nightly so recency scores keep up with the calendar).
+"""
+from datetime import datetime
+
+from sqlalchemy import case, func, literal, select, update
+from sqlalchemy.dialects.mysql import insert
+
+from models import db, Customer, CustomerSegment, Transaction
+
+RECENCY_DAYS = (14, 30, 60, 120)  # days since last visit at or below each bound -> score 5, 4, 3, 2; older -> 1
+FREQUENCY_VISITS = (2, 3, 5, 10)  # visits at or above each bound -> score 2, 3, 4, 5
+MONETARY_SPEND = (2000, 5000, 10000, 25000)  # paid spend at or above each bound -> score 2, 3, 4, 5
+
+# First matching rule wins; anything else is 'regular'
+SEGMENT_RULES = (
+    ('champions', lambda r, f, m: (r >= 4) & (f >= 4)),
+    ('loyal', lambda r, f, m: f >= 4),
+    ('new', lambda r, f, m: (f == 1) & (r >= 4)),
+    ('at_risk', lambda r, f, m: (r <= 2) & (f >= 3)),
+    ('lost', lambda r, f, m: r == 1),
+    ('promising', lambda r, f, m: r >= 4),
+)
+SEGMENTS = tuple(name for name, _ in SEGMENT_RULES) + ('regular',)
+
+AUDIENCES = [
+    ('all', 'All Customers'),
+    ('new_customers', 'New Customers'),
+    ('loyal_customers', 'Loyal Customers'),
+    ('champions', 'Champions (recent and frequent)'),
+    ('at_risk', 'At Risk (regulars who stopped visiting)'),
+    ('lost', 'Lapsed (no visit in 4+ months)'),
+    ('high_value', 'High Spenders'),
+]
+
+
+def _ascending_score(value, bounds):
+    return case(*[(value >= bound, score) for score, bound in reversed(list(enumerate(bounds, start=2)))], else_=1)
+
+
+def _recency_score(days):
+    return case(*[(days <= bound, 5 - index) for index, bound in enumerate(RECENCY_DAYS)], else_=1)
+
+
+def _segment_label():
+    scores = (CustomerSegment.recency_score, CustomerSegment.frequency_score, CustomerSegment.monetary_score)
+    return case(*[(rule(*scores), name) for name, rule in SEGMENT_RULES], else_='regular')
+
+
+def refresh_segments(customer_ids):
+    """Recompute segment rows for the given customers from their transactions (caller commits)"""
+    customer_ids = sorted(set(customer_ids))
+    if not customer_ids:
+        return 0
+    now = datetime.utcnow()
+    last_visit = func.max(Transaction.created_at)
+    visits = func.count(Transaction.id)
+    spend = func.coalesce(func.sum(case((Transaction.payment_status == 'paid', Transaction.total_amount), else_=0)), 0)
+
+    source = select(
+        Transaction.customer_id,
+        last_visit,
+        visits,
+        spend,
+        _recency_score(func.datediff(literal(now), last_visit)),
+        _ascending_score(visits, FREQUENCY_VISITS),
+        _ascending_score(spend, MONETARY_SPEND),
+        literal(now),
+    ).where(Transaction.customer_id.in_(customer_ids)).group_by(Transaction.customer_id)
+
+    columns = ['customer_id', 'last_visit', 'visit_count', 'monetary',
+               'recency_score', 'frequency_score', 'monetary_score', 'updated_at']
+    stmt = insert(CustomerSegment).from_select(columns, source)
+    db.session.execute(stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in columns[1:]}))
+    # Labels derive from the stored scores, so they are set in a second pass
+    db.session.execute(
+        update(CustomerSegment).where(
+            CustomerSegment.customer_id.in_(customer_ids)
+        ).values(segment=_segment_label()),
+        execution_options={'synchronize_session': False}
+    )
+    return len(customer_ids)
+
+
+def rebuild_segments(chunk_size=1000):
+    """Recompute every customer's segment, committing per chunk of customer ids; yields progress"""
+    last_id = 0
+    processed = 0
+    while True:
+        customer_ids = db.session.scalars(
+            select(Customer.id).where(Customer.id > last_id).order_by(Customer.id).limit(chunk_size)
+        ).all()
+        if not customer_ids:
+            break
+        refresh_segments(customer_ids)
+        db.session.commit()
+        processed += len(customer_ids)
+        last_id = customer_ids[-1]
+        yield processed
+
+
+def audience_query(audience):
+    """Customer query for a promotion target audience"""
+    query = Customer.query
+    if audience == 'all':
+        return query
+    if audience == 'new_customers':
+        # Fewer than 3 transactions; customers who never bought have no segment row
+        return query.outerjoin(CustomerSegment).filter(func.coalesce(CustomerSegment.visit_count, 0) < 3)
+    if audience == 'loyal_customers':
+        return query.filter(Customer.loyalty_points > 100)
+    if audience == 'high_value':
+        return query.join(CustomerSegment).filter(CustomerSegment.monetary_score == 5)
+    if audience in SEGMENTS:
+        return query.join(CustomerSegment).filter(CustomerSegment.segment == audience)
+    raise ValueError(f"Unknown audience: {audience}")
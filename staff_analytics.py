@@ -0,0 +1,166 @@
+"""
+Staff Utilization and Occupancy Analytics
+Expands a week's scheduled/completed appointments (start + summed service
+durations) into per-minute busy masks per staff member with NumPy, then
+derives utilization matrices (day-of-week x hour-of-day), idle gaps within
+opening hours and no-show rates. Results are cached per week in
+staff_weekly_stats so views don't recompute from raw appointment rows.
+"""
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert
+
+from models import db, Appointment, AppointmentService, Service, Staff, StaffWeeklyStats
+
+MINUTES_PER_DAY = 24 * 60
+DAYS = 7
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+BUSY_STATUSES = ('scheduled', 'completed')
+
+
+def week_start_for(day):
+    """Monday of the week containing `day`"""
+    return day - timedelta(days=day.weekday())
+
+
+def _week_appointments(week_start):
+    """One grouped query: (staff_id, start, status, duration_minutes) for the week"""
+    start = datetime.combine(week_start, datetime.min.time())
+    end = start + timedelta(days=DAYS)
+    return db.session.query(
+        Appointment.staff_id,
+        Appointment.appointment_date,
+        Appointment.status,
+        func.coalesce(func.sum(Service.duration), 0)
+    ).outerjoin(
+        AppointmentService, AppointmentService.appointment_id == Appointment.id
+    ).outerjoin(
+        Service, Service.id == AppointmentService.service_id
+    ).filter(
+        Appointment.appointment_date >= start,
+        Appointment.appointment_date < end,
+        Appointment.status != 'cancelled'
+    ).group_by(Appointment.id, Appointment.staff_id, Appointment.appointment_date, Appointment.status).all()
+
+
+def busy_minutes(staff_index, starts, durations, staff_count):
+    """Boolean (staff, 7, 1440) mask of minutes covered by at least one appointment"""
+    minutes = DAYS * MINUTES_PER_DAY
+    starts = np.clip(starts, 0, minutes)
+    ends = np.clip(starts + durations, 0, minutes)
+    # Difference array: +1 at each start, -1 at each end, cumulative sum = concurrent appointments
+    diff = np.zeros((staff_count, minutes + 1), dtype=np.int32)
+    np.add.at(diff, (staff_index, starts), 1)
+    np.add.at(diff, (staff_index, ends), -1)
+    busy = np.cumsum(diff[:, :minutes], axis=1) > 0
+    return busy.reshape(staff_count, DAYS, MINUTES_PER_DAY)
+
+
+def idle_gaps(busy, open_hour, close_hour, min_minutes):
+    """Return [(staff_idx, day, start_minute, length)] for idle runs within opening hours"""
+    open_mask = np.zeros(MINUTES_PER_DAY, dtype=bool)
+    open_mask[open_hour * 60:close_hour * 60] = True
+    idle = (~busy & open_mask).astype(np.int8)
+    edges = np.diff(np.pad(idle, ((0, 0), (0, 0), (1, 1))), axis=-1)
+    # Runs are row-major ordered, so the k-th start pairs with the k-th end
+    staff_idx, day, run_start = np.nonzero(edges == 1)
+    _, _, run_end = np.nonzero(edges == -1)
+    lengths = run_end - run_start
+    keep = lengths >= min_minutes
+    return list(zip(staff_idx[keep].tolist(), day[keep].tolist(), run_start[keep].tolist(), lengths[keep].tolist()))
+
+
+def compute_week(week_start):
+    """Compute occupancy results for a week (uncached)"""
+    config = current_app.config
+    open_hour, close_hour = config['SALON_OPEN_HOUR'], config['SALON_CLOSE_HOUR']
+    rows = _week_appointments(week_start)
+
+    staff_rows = Staff.query.with_entities(Staff.id, Staff.name).filter(
+        (Staff.is_active == True) | Staff.id.in_({row[0] for row in rows})
+    ).order_by(Staff.name).all()
+    position = {staff_id: index for index, (staff_id, _) in enumerate(staff_rows)}
+    staff_count = len(staff_rows)
+
+    staff_index = np.array([position[row[0]] for row in rows], dtype=np.int64)
+    starts = ((np.array([row[1] for row in rows], dtype='datetime64[m]')
+               - np.datetime64(week_start, 'm')).astype(np.int64)) if rows else np.zeros(0, dtype=np.int64)
+    statuses = np.array([row[2] for row in rows], dtype=object)
+    durations = np.array([int(row[3]) for row in rows], dtype=np.int64)
+
+    counts_busy = np.isin(statuses, BUSY_STATUSES) if rows else np.zeros(0, dtype=bool)
+    busy = busy_minutes(staff_index[counts_busy], starts[counts_busy], durations[counts_busy], staff_count)
+
+    # Utilization: share of each hour that is booked, per staff x weekday x hour
+    hourly = busy.reshape(staff_count, DAYS, 24, 60).mean(axis=-1)
+    open_hours = slice(open_hour, close_hour)
+    open_utilization = hourly[:, :, open_hours].mean(axis=(1, 2)) if staff_count else np.zeros(0)
+
+    appointment_counts = np.bincount(staff_index, minlength=staff_count)
+    completed = np.bincount(staff_index[statuses == 'completed'], minlength=staff_count) if rows else np.zeros(staff_count)
+    no_shows = np.bincount(staff_index[statuses == 'no-show'], minlength=staff_count) if rows else np.zeros(staff_count)
+    resolved = completed + no_shows
+
+    gaps = {index: [] for index in range(staff_count)}
+    for index, day, start_minute, length in idle_gaps(busy, open_hour, close_hour, config['IDLE_GAP_MINUTES']):
+        gaps[index].append({
+            'day': WEEKDAYS[day],
+            'start': f"{start_minute // 60:02d}:{start_minute % 60:02d}",
+            'minutes': length,
+        })
+
+    staff = []
+    for index, (staff_id, name) in enumerate(staff_rows):
+        staff.append({
+            'id': staff_id,
+            'name': name,
+            'appointments': int(appointment_counts[index]),
+            'busy_minutes': int(busy[index].sum()),
+            'utilization': round(float(open_utilization[index]), 4),
+            'by_weekday': np.round(hourly[index][:, open_hours].mean(axis=1), 4).tolist(),
+            'by_hour': np.round(hourly[index].mean(axis=0), 4).tolist(),
+            'matrix': np.round(hourly[index], 4).tolist(),
+            'no_show_rate': round(float(no_shows[index] / resolved[index]), 4) if resolved[index] else None,
+            'idle_gaps': sorted(gaps[index], key=lambda gap: -gap['minutes']),
+        })
+
+    return {
+        'week_start': week_start.isoformat(),
+        'open_hour': open_hour,
+        'close_hour': close_hour,
+        'weekdays': WEEKDAYS,
+        'staff': staff,
+    }
+
+
+def _is_fresh(stats, week_start):
+    # computed_at and appointment times are both local wall-clock time
+    week_end = datetime.combine(week_start + timedelta(days=DAYS), datetime.min.time())
+    if stats.computed_at >= week_end:
+        # Computed after the week ended: late cancellations and no-shows call invalidate_week()
+        return True
+    return (datetime.now() - stats.computed_at).total_seconds() < current_app.config['STAFF_STATS_TTL']
+
+
+def invalidate_week(day):
+    """Drop the cached results for the week containing `day` (call before committing a status change)"""
+    StaffWeeklyStats.query.filter_by(week_start=week_start_for(day)).delete()
+
+
+def weekly_occupancy(week_start, refresh=False):
+    """Cached occupancy results for a week, recomputed when stale"""
+    stats = StaffWeeklyStats.query.filter_by(week_start=week_start).first()
+    if stats is not None and not refresh and _is_fresh(stats, week_start):
+        return json.loads(stats.data)
+
+    result = compute_week(week_start)
+    payload = json.dumps(result)
+    now = datetime.now()
+    stmt = insert(StaffWeeklyStats).values(week_start=week_start, data=payload, computed_at=now)
+    db.session.execute(stmt.on_duplicate_key_update(data=payload, computed_at=now))
+    db.session.commit()
+    return result
@@ -0,0 +1,34 @@
+"""
+Compiled Template Cache
+Jinja compiles each template to Python the first time it is rendered, per
+process. To keep that off the request path:
+- compiled bytecode is stored in TEMPLATE_CACHE_DIR (instance/jinja_cache by
+  default), so restarts and new workers load it instead of recompiling
+  (entries are keyed by template source, so edited templates recompile)
+- every template under templates/ is loaded once in create_app(); with
+  gunicorn's preload_app that happens in the master, and forked workers
+  inherit the compiled templates
+"""
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+
+def init_template_cache(app):
+    """Attach the bytecode cache and precompile all templates, as configured"""
+    if app.config.get('TEMPLATE_BYTECODE_CACHE'):
+        directory = app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    if app.config.get('TEMPLATE_PRECOMPILE'):
+        precompile_templates(app)
+
+
+def precompile_templates(app):
+    """Load every template into the environment's cache; returns (count, seconds)"""
+    started = time.perf_counter()
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names), time.perf_counter() - started
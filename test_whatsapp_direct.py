@@ -11,11 +11,13 @@ if sys.platform == 'win32':
     os.system('chcp 65001 >nul 2>&1')
     sys.stdout.reconfigure(encoding='utf-8') if hasattr(sys.stdout, 'reconfigure') else None
 
-from app import app, db
+from app import create_app
+from models import db
 from models import Staff, Service, Appointment, Customer
 from whatsapp_handler import WhatsAppAppointmentHandler
 
 def test_whatsapp_booking():
+    app = create_app()
     phone = "1245343453"
     
     with app.app_context():
@@ -0,0 +1,99 @@
+"""
+Cached User Loading for Flask-Login
+load_user() serves a lightweight UserSnapshot from a per-process cache (short
+TTL) instead of querying users on every authenticated request.
+- Updates/deletes of a User in this process invalidate its entry immediately.
+- Other processes pick changes up within USER_CACHE_TTL seconds.
+- The session stores a fingerprint of the password hash and role taken at
+  login; a snapshot whose fingerprint no longer matches logs the session out,
+  so password changes and role revocations end existing sessions.
+"""
+import hashlib
+import threading
+import time
+
+from flask import current_app, session
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from models import db, User
+
+_FINGERPRINT_KEY = '_auth_fp'
+
+
+def auth_fingerprint(user):
+    """Short digest of the credentials/permissions a session was granted with"""
+    return hashlib.sha256(f"{user.password_hash}|{user.role}".encode()).hexdigest()[:16]
+
+
+class UserSnapshot(UserMixin):
+    """Read-only copy of the User fields used by views and templates"""
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.role = user.role
+        self.staff_id = user.staff_id
+        self.fingerprint = auth_fingerprint(user)
+
+
+class UserCache:
+    """Thread-safe {user_id: (snapshot, expires_at)} cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def put(self, snapshot, ttl):
+        with self._lock:
+            self._entries[snapshot.id] = (snapshot, time.monotonic() + ttl)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def load_cached_user(user_id):
+    """Flask-Login user_loader body: cached snapshot, verified against the session fingerprint"""
+    user_id = int(user_id)
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot(user)
+        user_cache.put(snapshot, current_app.config['USER_CACHE_TTL'])
+
+    expected = session.get(_FINGERPRINT_KEY)
+    if expected is None:
+        # Sessions created before fingerprints existed adopt the current one
+        session[_FINGERPRINT_KEY] = snapshot.fingerprint
+    elif expected != snapshot.fingerprint:
+        return None
+    return snapshot
+
+
+def remember_login(user):
+    """Record the fingerprint of a freshly authenticated user in the session"""
+    session[_FINGERPRINT_KEY] = auth_fingerprint(user)
+    user_cache.put(UserSnapshot(user), current_app.config['USER_CACHE_TTL'])
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
@@ -1,19 +1,21 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from io import BytesIO
-import openpyxl
-from openpyxl.styles import Font, Alignment
 from datetime import datetime
-import requests
 import os
 from flask import current_app
 
+# ReportLab, openpyxl and requests are imported inside the functions that use
+# them so that workers and CLI scripts which never render a PDF/report don't
+# pay their import cost at boot.
+
 def generate_invoice_pdf(transaction):
     """Generate PDF invoice for a transaction"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER
+    
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
     story = []
@@ -37,8 +39,8 @@ def generate_invoice_pdf(transaction):
     invoice_data = [
         ['Invoice Number:', transaction.invoice_number],
         ['Date:', transaction.created_at.strftime('%Y-%m-%d %H:%M')],
-        ['Customer:', transaction.customer.name],
-        ['Mobile:', transaction.customer.mobile],
+        ['Customer:', transaction.customer.name if transaction.customer else 'Archived customer'],
+        ['Mobile:', transaction.customer.mobile if transaction.customer else ''],
     ]
     
     invoice_table = Table(invoice_data, colWidths=[2*inch, 4*inch])
@@ -97,26 +99,16 @@ def generate_invoice_pdf(transaction):
 
 def generate_excel_report(period='month'):
     """Generate Excel report for financial data"""
-    from models import Transaction, db
-    from datetime import datetime, timedelta
+    import openpyxl
+    from openpyxl.styles import Font, Alignment
+    from sqlalchemy.orm import joinedload
+    from models import Transaction
+    from finance_analytics import period_range, created_between
     
-    today = datetime.now().date()
-    if period == 'day':
-        start_date = today
-        end_date = today
-    elif period == 'week':
-        start_date = today - timedelta(days=7)
-        end_date = today
-    elif period == 'month':
-        start_date = datetime.now().replace(day=1).date()
-        end_date = today
-    else:
-        start_date = datetime.now().replace(month=1, day=1).date()
-        end_date = today
+    start_date, end_date = period_range(period)
     
-    transactions = Transaction.query.filter(
-        db.func.date(Transaction.created_at) >= start_date,
-        db.func.date(Transaction.created_at) <= end_date
+    transactions = Transaction.query.options(joinedload(Transaction.customer)).filter(
+        *created_between(start_date, end_date)
     ).order_by(Transaction.created_at).all()
     
     wb = openpyxl.Workbook()
@@ -137,7 +129,7 @@ def generate_excel_report(period='month'):
         ws.append([
             txn.created_at.strftime('%Y-%m-%d %H:%M'),
             txn.invoice_number,
-            txn.customer.name,
+            txn.customer.name if txn.customer else 'Archived customer',
             txn.amount,
             txn.discount,
             txn.tax,
@@ -156,6 +148,40 @@ def generate_excel_report(period='month'):
     buffer.seek(0)
     return buffer
 
+def generate_attendance_excel(matrix):
+    """Export a monthly attendance matrix to Excel (write-only, rows are streamed)"""
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from attendance import STATUS_CODES
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(f"Attendance {matrix['year']}-{matrix['month']:02d}")
+
+    headers = ['Staff'] + [day.day for day in matrix['days']] + [
+        'Present', 'Late', 'Absent', 'Leave', 'Late (min)', 'Overtime (min)'
+    ]
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = Font(bold=True)
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    for entry in matrix['staff']:
+        totals = entry['totals']
+        ws.append(
+            [entry['name']]
+            + [STATUS_CODES.get(day['status'], day['status']) if day else '' for day in entry['days']]
+            + [totals['present'], totals['late'], totals['absent'], totals['leave'],
+               totals['late_minutes'], totals['overtime_minutes']]
+        )
+
+    buffer = BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
 def send_whatsapp_message(phone_number, message):
     """Send WhatsApp message using API"""
     # Normalize phone number
@@ -198,6 +224,8 @@ def send_whatsapp_message(phone_number, message):
             print(f"{'='*60}\n")
         return True
     
+    import requests
+    
     try:
         # WhatsApp Cloud API format
         if 'graph.facebook.com' in api_url or 'whatsapp' in api_url.lower():
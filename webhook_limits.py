@@ -0,0 +1,164 @@
+"""
+WhatsApp Webhook Limits
+/webhook/whatsapp needs no login, so a spam burst or a provider replay storm
+must not be able to tie up every worker thread and DB connection:
+- per sender: a token bucket (WHATSAPP_SENDER_RATE messages/sec, bursts of
+  WHATSAPP_SENDER_BURST); messages over it are dropped and acknowledged with
+  200 so the provider does not redeliver them
+- per process: at most WEBHOOK_MAX_IN_FLIGHT deliveries are processed at once
+  and WEBHOOK_MAX_QUEUED more may wait up to WEBHOOK_QUEUE_TIMEOUT seconds;
+  anything beyond that gets an immediate 429 and is retried by the provider
+Keep WEBHOOK_MAX_IN_FLIGHT + WEBHOOK_MAX_QUEUED below GUNICORN_THREADS so a
+flood always leaves threads free for the admin UI.
+Buckets live in process memory (each worker limits on its own). Set
+RATE_LIMIT_REDIS_URL (requires `pip install redis`) to share them across
+workers and hosts; if Redis is unreachable (or redis is not installed) the
+in-memory buckets are used for REDIS_RETRY_SECONDS before Redis is tried
+again, and the fallback is logged once per outage.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import current_app
+
+MAX_TRACKED_SENDERS = 100000  # in-memory buckets kept, least recently used evicted
+REDIS_RETRY_SECONDS = 30  # limit in memory this long after a Redis failure before trying again
+
+_TOKEN_BUCKET_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return allowed
+"""
+
+
+class TokenBuckets:
+    """Thread-safe per-key token buckets in process memory"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> (tokens, last_refill)
+
+    def allow(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > MAX_TRACKED_SENDERS:
+                self._buckets.popitem(last=False)
+        return allowed
+
+
+class RedisTokenBuckets:
+    """Token buckets shared through Redis; one atomic script call per check"""
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2)
+        self._script = self._client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    def allow(self, key, rate, burst):
+        return bool(self._script(keys=[f'whatsapp:rate:{key}'], args=[rate, burst, time.time()]))
+
+
+class AdmissionControl:
+    """Per-process cap on concurrent deliveries with a bounded, time-limited wait"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+
+    def acquire(self, max_in_flight, max_queued, timeout):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if self._in_flight >= max_in_flight and self._waiting >= max_queued:
+                return False
+            self._waiting += 1
+            try:
+                while self._in_flight >= max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+
+local_buckets = TokenBuckets()
+admission = AdmissionControl()
+_shared_buckets = {}  # redis url -> RedisTokenBuckets (kept across failures; the client reconnects)
+_redis_retry_at = {}  # redis url -> monotonic time after which a failed Redis is tried again
+_redis_lock = threading.Lock()
+
+
+def _shared_allow(url, phone, rate, burst):
+    """Check the shared bucket; None while Redis is failing or backing off"""
+    if time.monotonic() < _redis_retry_at.get(url, 0):
+        return None
+    try:
+        buckets = _shared_buckets.get(url)
+        if buckets is None:
+            buckets = _shared_buckets[url] = RedisTokenBuckets(url)
+        allowed = buckets.allow(phone, rate, burst)
+    except Exception as e:
+        with _redis_lock:
+            first_failure = url not in _redis_retry_at
+            _redis_retry_at[url] = time.monotonic() + REDIS_RETRY_SECONDS
+        if first_failure:
+            current_app.logger.warning('Shared rate limiter unavailable, limiting in memory '
+                                       '(retrying every %ss): %s', REDIS_RETRY_SECONDS, e)
+        return None
+    if url in _redis_retry_at:
+        with _redis_lock:
+            recovered = _redis_retry_at.pop(url, None) is not None
+        if recovered:
+            current_app.logger.info('Shared rate limiter reachable again')
+    return allowed
+
+
+def sender_allowed(phone):
+    """Take one token from a normalized phone's bucket; False if the sender is over its rate"""
+    config = current_app.config
+    rate, burst = config['WHATSAPP_SENDER_RATE'], config['WHATSAPP_SENDER_BURST']
+    url = config['RATE_LIMIT_REDIS_URL']
+    if url:
+        allowed = _shared_allow(url, phone, rate, burst)
+        if allowed is not None:
+            return allowed
+    return local_buckets.allow(phone, rate, burst)
+
+
+@contextmanager
+def webhook_slot():
+    """Yield True while holding one of this process's webhook slots, False if overloaded"""
+    config = current_app.config
+    admitted = admission.acquire(config['WEBHOOK_MAX_IN_FLIGHT'], config['WEBHOOK_MAX_QUEUED'],
+                                 config['WEBHOOK_QUEUE_TIMEOUT'])
+    try:
+        yield admitted
+    finally:
+        if admitted:
+            admission.release()
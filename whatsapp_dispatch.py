@@ -0,0 +1,122 @@
+"""
+WhatsApp Message Dispatch
+Inbound messages are processed one at a time per phone number so concurrent
+webhook deliveries cannot create duplicate active conversations or overwrite
+each other's step/data:
+- within a worker process, messages are routed to one of WHATSAPP_SHARDS
+  single-threaded queues by crc32 of the normalized phone; one phone is always
+  handled by the same shard, in arrival order, while other phones run in parallel
+- across worker processes (and hosts), each message is handled while holding a
+  MySQL advisory lock (GET_LOCK) named after the phone
+"""
+import os
+import queue
+import threading
+import zlib
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import text
+
+from message_dedup import claim_message, release_message
+from models import db
+from whatsapp_handler import WhatsAppAppointmentHandler, normalize_phone
+
+
+def shard_for(phone, shards):
+    """Shard index for a normalized phone number (stable across processes)"""
+    return zlib.crc32(phone.encode('utf-8')) % shards
+
+
+@contextmanager
+def phone_lock(phone, timeout):
+    """Hold the cross-process advisory lock for one phone number"""
+    name = f'whatsapp:{phone}'
+    # Dedicated connection: the lock belongs to it, not to the handler's transactions
+    with db.engine.connect() as connection:
+        acquired = connection.execute(text('SELECT GET_LOCK(:name, :timeout)'),
+                                      {'name': name, 'timeout': timeout}).scalar()
+        if acquired != 1:
+            raise TimeoutError(f'Conversation for {phone} is busy')
+        try:
+            yield
+        finally:
+            connection.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': name})
+
+
+def process_message(phone, message_text, message_id=None):
+    """Handle one message for a normalized phone under its advisory lock; returns the reply"""
+    try:
+        with phone_lock(phone, current_app.config['WHATSAPP_LOCK_TIMEOUT']):
+            # The handler's first query (and so its snapshot) starts after the lock is held
+            handler = WhatsAppAppointmentHandler(phone)
+            return handler.handle_message(message_text)
+    except Exception:
+        if message_id:
+            release_message(message_id)
+        raise
+
+
+class ShardedExecutor:
+    """Per-process pool of single-threaded queues keyed by phone number"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._app = None
+        self._queues = []
+
+    def submit(self, phone_number, message_text, message_id=None):
+        """Queue a message on its phone's shard; returns a Future with the reply"""
+        phone = normalize_phone(phone_number)
+        future = Future()
+        with self._lock:
+            self._start_workers()
+            self._queues[shard_for(phone, len(self._queues))].put((future, phone, message_text, message_id))
+        return future
+
+    def _start_workers(self):
+        if self._pid == os.getpid():
+            return
+        # First message in this process (or first after a fork, which does not copy threads)
+        self._pid = os.getpid()
+        self._app = current_app._get_current_object()
+        self._queues = [queue.SimpleQueue() for _ in range(max(1, self._app.config['WHATSAPP_SHARDS']))]
+        for index, shard_queue in enumerate(self._queues):
+            threading.Thread(target=self._run, args=(shard_queue,), name=f'whatsapp-shard-{index}', daemon=True).start()
+
+    def _run(self, shard_queue):
+        while True:
+            future, phone, message_text, message_id = shard_queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                # Fresh app context per message: its own session, removed afterwards
+                with self._app.app_context():
+                    future.set_result(process_message(phone, message_text, message_id))
+            except Exception as e:
+                future.set_exception(e)
+
+
+executor = ShardedExecutor()
+
+
+def dispatch_messages(messages):
+    """Process [(phone_number, message_text, message_id)] through the shards and wait; returns the replies in order
+
+    Messages whose provider id was already processed are skipped (reply None).
+    """
+    futures = []
+    for phone_number, message_text, message_id in messages:
+        if message_id and not claim_message(message_id):
+            futures.append(None)
+            continue
+        futures.append(executor.submit(phone_number, message_text, message_id))
+    timeout = current_app.config['WHATSAPP_DISPATCH_TIMEOUT']
+    return [future.result(timeout=timeout) if future else None for future in futures]
+
+
+def dispatch_message(phone_number, message_text, message_id=None):
+    """Process one message through its shard and wait for the reply"""
+    return dispatch_messages([(phone_number, message_text, message_id)])[0]
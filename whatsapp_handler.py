@@ -7,8 +7,19 @@ import re
 from datetime import datetime, timedelta
 from flask import current_app
 from models import db, Customer, Staff, Service, Appointment, AppointmentService, WhatsAppConversation
+from archive import archived_customer_id_by_mobile, unarchive_customer
+from conversation_retention import EXPIRED_STEP, is_stale, unpack_data
 from utils import send_whatsapp_message
 
+def normalize_phone(phone):
+    """Normalize a phone number to 91XXXXXXXXXX (remove +, spaces, etc.)"""
+    phone = re.sub(r'[^\d]', '', phone)
+    if phone.startswith('91') and len(phone) == 12:
+        phone = phone[2:]
+    if len(phone) == 10:
+        phone = '91' + phone
+    return phone
+
 class WhatsAppAppointmentHandler:
     """Handles WhatsApp appointment booking conversations"""
     
@@ -34,12 +45,7 @@ class WhatsAppAppointmentHandler:
     
     def _normalize_phone(self, phone):
         """Normalize phone number (remove +, spaces, etc.)"""
-        phone = re.sub(r'[^\d]', '', phone)
-        if phone.startswith('91') and len(phone) == 12:
-            phone = phone[2:]
-        if len(phone) == 10:
-            phone = '91' + phone
-        return phone
+        return normalize_phone(phone)
     
     def _get_or_create_conversation(self):
         """Get existing conversation or create new one"""
@@ -48,6 +54,12 @@ class WhatsAppAppointmentHandler:
             is_active=True
         ).first()
         
+        if conv and is_stale(conv):
+            # Abandoned booking; start over instead of resuming a day-old step
+            conv.is_active = False
+            conv.step = EXPIRED_STEP
+            conv = None
+        
         if not conv:
             conv = WhatsAppConversation(
                 phone_number=self.phone_number,
@@ -62,7 +74,8 @@ class WhatsAppAppointmentHandler:
     def _load_data(self):
         """Load conversation data from JSON"""
         try:
-            return json.loads(self.conversation.data) if self.conversation.data else {}
+            data = unpack_data(self.conversation.data)
+            return json.loads(data) if data else {}
         except:
             return {}
     
@@ -196,8 +209,13 @@ Please provide your *name*:"""
         self.conversation.step = self.STEP_EMAIL
         self._save_data()
         
-        # Check if customer exists, if not create (without email yet)
+        # Check if customer exists (restoring an archived one), if not create (without email yet)
         customer = Customer.query.filter_by(mobile=mobile).first()
+        archived_id = archived_customer_id_by_mobile(mobile) if not customer else None
+        if archived_id:
+            unarchive_customer(archived_id)
+            db.session.commit()
+            customer = db.session.get(Customer, archived_id)
         if not customer:
             customer = Customer(
                 name=self.data.get('name', ''),